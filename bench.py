@@ -0,0 +1,102 @@
+from bitboard import *
+from bot import PotentialMove
+from minimax import *
+from perft import POSITIONS
+from typing import *
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+
+def bench_parallel(backend: str = 'bitboard', depth: int = 4, worker_counts: Sequence[int] = (1, 2, 4, 8)) -> None:
+    """
+    Searches every position of perft.POSITIONS to depth with each number of workers, printing the time,
+    nodes/second and speedup over a single process (a plain GameState search).
+    """
+    base = None
+    for workers in worker_counts:
+        pool = ProcessPoolExecutor(workers) if workers > 1 else None
+        nodes, start = 0, time.perf_counter()
+        for name, fen, _ in POSITIONS:
+            b = BACKENDS[backend].from_fen(fen)
+            search = ParallelSearch(b, depth, workers, pool) if pool is not None else GameState(b, depth)
+            nodes += search.nodes + search.qnodes
+        elapsed = time.perf_counter() - start
+        if pool is not None:
+            pool.shutdown()
+        base = base or elapsed
+        print(f"{workers} worker{'s' if workers > 1 else ' '}: {elapsed:8.2f}s  {nodes:>9} nodes  "
+              f"{nodes / max(elapsed, 1e-9):>8.0f} nodes/s  speedup {base / elapsed:.2f}x")
+
+
+def instance_size(obj: object) -> int:
+    """Returns the size in bytes of obj, including its __dict__ if it has one."""
+    return sys.getsizeof(obj) + (sys.getsizeof(obj.__dict__) if hasattr(obj, '__dict__') else 0)
+
+
+def bench_memory(backend: str = 'object', depth: int = 3) -> None:
+    """
+    Prints the size of instances of the classes search creates, then searches every position of
+    perft.POSITIONS to depth, printing the peak memory allocated during each search per node searched.
+    The transposition table is allocated beforehand, so only the memory of the search itself is counted.
+    """
+    b = new_board('object')
+    pawn = b.occupant(5, 2)
+    instances = [("Pawn", pawn), ("Rook", b.occupant(1, 1)), ("Move", Move(5, 2, 5, 4, pawn)),
+                 ("ForcedMove", ForcedMove((5, 2), (5, 4), pawn)), ("PotentialMove", PotentialMove(((5, 2), (5, 4)), 0)),
+                 ("GameState", GameState(b, 1)), ("BitPiece", new_board('bitboard').occupant(5, 2))]
+    for name, obj in instances:
+        print(f"{name:<14} {instance_size(obj):>5} bytes")
+
+    total_nodes, total_peak = 0, 0
+    for name, fen, _ in POSITIONS:
+        b = BACKENDS[backend].from_fen(fen)
+        table = TranspositionTable()
+        tracemalloc.start()
+        start = tracemalloc.get_traced_memory()[0]
+        search = GameState(b, depth, table=table)
+        peak = tracemalloc.get_traced_memory()[1] - start
+        tracemalloc.stop()
+        nodes = search.nodes + search.qnodes
+        total_nodes, total_peak = total_nodes + nodes, total_peak + peak
+        print(f"{name:<12} {nodes:>8} nodes  peak {peak:>9} bytes  {peak / nodes:8.1f} bytes/node")
+    print(f"{backend}: {total_peak / total_nodes:.1f} peak bytes/node")
+
+
+def bench_memory_by_depth(backend: str = 'object', max_depth: int = 4) -> None:
+    """
+    Searches the start position to depths 1 to max_depth, printing the peak memory allocated by each search.
+    With a 1-entry transposition table the peak is that of the search alone, which only keeps the current
+    line, so it should grow with the depth rather than the number of nodes. A full-size table adds up to
+    its fixed capacity in entries.
+    """
+    for depth in range(1, max_depth + 1):
+        peaks = []
+        for table in (TranspositionTable(1), TranspositionTable()):
+            b = BACKENDS[backend]()
+            tracemalloc.start()
+            start = tracemalloc.get_traced_memory()[0]
+            search = GameState(b, depth, table=table)
+            peaks.append(tracemalloc.get_traced_memory()[1] - start)
+            tracemalloc.stop()
+        print(f"depth {depth}: {search.nodes + search.qnodes:>8} nodes  peak {peaks[0]:>8} bytes without table, "
+              f"{peaks[1]:>8} bytes with table")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Search benchmarks.")
+    parser.add_argument('--backend', choices=list(BACKENDS), default='bitboard')
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="worker process counts to compare")
+    parser.add_argument('--memory', action='store_true', help="measure memory instead of parallel speedup")
+    args = parser.parse_args()
+    if args.memory:
+        print(f"search memory, {args.backend} board, depth {args.depth}")
+        bench_memory(args.backend, args.depth)
+        bench_memory_by_depth(args.backend, args.depth)
+    else:
+        print(f"parallel search, {args.backend} board, depth {args.depth}, {os.cpu_count()} CPUs")
+        bench_parallel(args.backend, args.depth, args.workers)
@@ -0,0 +1,685 @@
+from main import *
+
+
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+KINDS = [Pawn, Knight, Bishop, Rook, Queen, King]  # Piece class of each bitboard kind.
+KIND_OF = {cls: kind for kind, cls in enumerate(KINDS)}
+
+# Move encoding: from_square | to_square << 6 | flag << 12
+NORMAL, DOUBLE_PUSH, EN_PASSANT, CASTLE, PROMOTION = range(5)
+
+KNIGHT_STEPS = [(1, 2), (1, -2), (-1, 2), (-1, -2), (2, 1), (2, -1), (-2, 1), (-2, -1)]
+KING_STEPS = [(1, 0), (0, 1), (-1, 0), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+ROOK_DIRECTIONS = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+BISHOP_DIRECTIONS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+
+def _step_table(steps: List[Tuple[int, int]]) -> List[int]:
+    """Returns, for every square, the mask of squares reachable by a single step in <steps>."""
+    table = []
+    for sq in range(64):
+        file, rank = sq % 8 + 1, sq // 8 + 1
+        mask = 0
+        for df, dr in steps:
+            if in_range((file + df, rank + dr)):
+                mask |= 1 << square_index(file + df, rank + dr)
+        table.append(mask)
+    return table
+
+
+def _ray_table(direction: Tuple[int, int]) -> List[int]:
+    """Returns, for every square, the mask of squares along <direction> up to the edge of the board."""
+    table = []
+    for sq in range(64):
+        file, rank = sq % 8 + 1 + direction[0], sq // 8 + 1 + direction[1]
+        mask = 0
+        while in_range((file, rank)):
+            mask |= 1 << square_index(file, rank)
+            file, rank = file + direction[0], rank + direction[1]
+        table.append(mask)
+    return table
+
+
+def _slider_rays(directions: List[Tuple[int, int]]) -> List[List[Tuple[int, bool, List[int]]]]:
+    """
+    Returns, for every square, a list of (ray mask, positive, ray table) for each direction.
+    A positive direction increases the square index, so its nearest blocker is the lowest set bit.
+    """
+    tables = [(_ray_table(d), d[1] > 0 or (d[1] == 0 and d[0] > 0)) for d in directions]
+    return [[(table[sq], positive, table) for table, positive in tables] for sq in range(64)]
+
+
+KNIGHT_ATTACKS = _step_table(KNIGHT_STEPS)
+KING_ATTACKS = _step_table(KING_STEPS)
+PAWN_ATTACKS = [_step_table([(1, -1), (-1, -1)]), _step_table([(1, 1), (-1, 1)])]  # Indexed by int(white).
+_ROOK_RAYS = _slider_rays(ROOK_DIRECTIONS)
+_BISHOP_RAYS = _slider_rays(BISHOP_DIRECTIONS)
+
+# Castling rights that survive a move from or to each square.
+_CASTLE_MASK = [15] * 64
+_CASTLE_MASK[square_index(1, 1)] = 15 ^ WHITE_QUEENSIDE
+_CASTLE_MASK[square_index(8, 1)] = 15 ^ WHITE_KINGSIDE
+_CASTLE_MASK[square_index(5, 1)] = 15 ^ (WHITE_KINGSIDE | WHITE_QUEENSIDE)
+_CASTLE_MASK[square_index(1, 8)] = 15 ^ BLACK_QUEENSIDE
+_CASTLE_MASK[square_index(8, 8)] = 15 ^ BLACK_KINGSIDE
+_CASTLE_MASK[square_index(5, 8)] = 15 ^ (BLACK_KINGSIDE | BLACK_QUEENSIDE)
+
+_SQUARE_SCORES = [[SQUARE_SCORES[cls, white] for cls in KINDS] for white in (False, True)]  # Same as Board.
+_ZOBRIST = [[ZOBRIST_PIECES[cls, white] for cls in KINDS] for white in (False, True)]  # Same keys as Board.
+_SYMBOLS = ['.', 'N', 'B', 'R', 'Q', 'K']  # Same symbols as Board.__str__; black pieces are lowercase (',' for pawns).
+
+
+def _slide(sq: int, occupied: int, rays: List[List[Tuple[int, bool, List[int]]]]) -> int:
+    attacks = 0
+    for ray, positive, table in rays[sq]:
+        blockers = ray & occupied
+        if blockers:
+            if positive:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= table[blocker]
+        attacks |= ray
+    return attacks
+
+
+def _nearest(blockers: int, positive: bool) -> int:
+    """Returns the square of the blocker in blockers nearest to the start of a ray (see _slider_rays)."""
+    return (blockers & -blockers).bit_length() - 1 if positive else blockers.bit_length() - 1
+
+
+def rook_attacks(sq: int, occupied: int) -> int:
+    return _slide(sq, occupied, _ROOK_RAYS)
+
+
+def bishop_attacks(sq: int, occupied: int) -> int:
+    return _slide(sq, occupied, _BISHOP_RAYS)
+
+
+def squares_of(bb: int) -> List[int]:
+    """Returns the indices of the set bits of bb, lowest first."""
+    out = []
+    while bb:
+        low = bb & -bb
+        out.append(low.bit_length() - 1)
+        bb ^= low
+    return out
+
+
+def encode_move(from_sq: int, to_sq: int, flag: int = NORMAL) -> int:
+    return from_sq | to_sq << 6 | flag << 12
+
+
+class BitPiece:
+    """
+    A lightweight view of a piece on a BitBoard, with the same attributes as Piece.
+    Views are created on demand and are not updated when the board changes.
+    """
+    __slots__ = ('file', 'rank', 'white', 'board', 'type')
+    file: int
+    rank: int
+    white: bool
+    board: 'BitBoard'
+    type: type
+
+    def __init__(self, file: int, rank: int, white: bool, board: 'BitBoard', kind: int):
+        self.file = file
+        self.rank = rank
+        self.white = white
+        self.board = board
+        self.type = KINDS[kind]
+
+    def __str__(self) -> str:
+        return f"{'White' if self.white else 'Black'} {self.type.__name__.lower()} " \
+               f"at {human_out((self.file, self.rank))}"
+
+    def available_moves(self) -> List[Tuple[int, int]]:
+        """Returns list of available moves for that piece (like dots in lichess)."""
+        if self.board.turn != self.white:
+            return []
+        return self.board.moves_from(self.file, self.rank)
+
+
+class BitBoard:
+    """
+    A chess board stored as bitboards, with the same interface as Board.
+    _bb[int(white)][kind] is a 64-bit int with a bit set on square_index(file, rank) for every such piece.
+    en_passant is the file where the pawn can be captured.
+    """
+    _bb: List[List[int]]                       # Piece bitboards, indexed by colour then kind.
+    _occupied: List[int]                       # Occupancy of each colour.
+    _mailbox: List[Optional[Tuple[int, int]]]  # (colour, kind) on each square, or None.
+    _history: List[tuple]                      # Undo records for unmake_move.
+    position_history: List[int]                # Zobrist hashes of the earlier positions of the game, oldest first.
+    turn: bool
+    castling: int
+    en_passant: Optional[int]
+    is_playable: bool
+    moves_made: int                            # Keeps track of how many moves (by white) have been made.
+    halfmove_clock: int                        # Moves (by either side) since the last capture or pawn move.
+    zobrist: int                               # Zobrist hash of the position, equal to Board.zobrist.
+    _score: List[List[int]]                    # Material plus piece-square score per colour and phase, as Board.
+    _moves_cache: Optional[List[int]]          # legal_moves() of the position.
+    _status_cache: Optional[int]               # status() of the position.
+
+    def __init__(self, ready_to_play: bool = True):
+        self._bb = [[0] * 6, [0] * 6]
+        self._occupied = [0, 0]
+        self._mailbox = [None] * 64
+        self._history = []
+        self.position_history = []
+        self.turn = True
+        self.castling = 0
+        self.en_passant = None
+        self.is_playable = ready_to_play
+        self.moves_made = 0
+        self.halfmove_clock = 0
+        self.zobrist = 0
+        self._score = [[0, 0], [0, 0]]
+        self._moves_cache, self._status_cache = None, None
+        if ready_to_play:
+            back_rank = [ROOK, KNIGHT, BISHOP, QUEEN, KING, BISHOP, KNIGHT, ROOK]
+            for file in range(1, 9):
+                self.put(True, back_rank[file - 1], file, 1)
+                self.put(True, PAWN, file, 2)
+                self.put(False, PAWN, file, 7)
+                self.put(False, back_rank[file - 1], file, 8)
+            self.castling = WHITE_KINGSIDE | WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE
+        self.zobrist = self.compute_zobrist()
+
+    def copy(self) -> 'BitBoard':
+        c = BitBoard(False)
+        c._bb = [self._bb[0][:], self._bb[1][:]]
+        c._occupied = self._occupied[:]
+        c._mailbox = self._mailbox[:]
+        c.turn, c.castling, c.en_passant = self.turn, self.castling, self.en_passant
+        c.is_playable, c.moves_made, c.zobrist = self.is_playable, self.moves_made, self.zobrist
+        c.halfmove_clock = self.halfmove_clock
+        c._score = [self._score[0][:], self._score[1][:]]
+        c.position_history = self.position_history[:]
+        c._history = self._history[:]
+        return c
+
+    @classmethod
+    def from_fen(cls, fen: str) -> 'BitBoard':
+        """Returns a new board set up from a FEN string (see Board.from_fen)."""
+        placement, turn, castling, en_passant, halfmove_clock, fullmove = parse_fen(fen)
+        b = cls(False)
+        for piece_type, white, file, rank in placement:
+            b.put(white, KIND_OF[piece_type], file, rank)
+        # Only keep castling rights whose king and rook are in place, as Board.from_fen does.
+        for right, rook_file, rank, color in ((WHITE_KINGSIDE, 8, 1, 1), (WHITE_QUEENSIDE, 1, 1, 1),
+                                              (BLACK_KINGSIDE, 8, 8, 0), (BLACK_QUEENSIDE, 1, 8, 0)):
+            if b._mailbox[square_index(5, rank)] == (color, KING) and \
+                    b._mailbox[square_index(rook_file, rank)] == (color, ROOK):
+                b.castling |= castling & right
+        b.turn, b.en_passant, b.halfmove_clock = turn, en_passant, halfmove_clock
+        b.moves_made = fullmove - int(turn)
+        b.check_if_playable()
+        b.zobrist = b.compute_zobrist()
+        return b
+
+    def to_fen(self) -> str:
+        """Returns the FEN string of the position."""
+        return fen_of(self)
+
+    def castling_rights(self) -> int:
+        return self.castling
+
+    def compute_zobrist(self) -> int:
+        """Computes the Zobrist hash of the position from scratch."""
+        out = 0
+        for color in (0, 1):
+            for kind in range(6):
+                for sq in squares_of(self._bb[color][kind]):
+                    out ^= _ZOBRIST[color][kind][sq]
+        out ^= ZOBRIST_CASTLING[self.castling]
+        if self.en_passant is not None:
+            out ^= ZOBRIST_EN_PASSANT[self.en_passant]
+        if not self.turn:
+            out ^= ZOBRIST_BLACK_TO_MOVE
+        return out
+
+    def put(self, white: bool, kind: int, file: int, rank: int) -> None:
+        """Places a piece on an empty square."""
+        sq = square_index(file, rank)
+        self._set(int(white), kind, sq)
+        self._moves_cache, self._status_cache = None, None
+
+    def _set(self, color: int, kind: int, sq: int) -> None:
+        self._bb[color][kind] |= 1 << sq
+        self._occupied[color] |= 1 << sq
+        self._mailbox[sq] = (color, kind)
+        self.zobrist ^= _ZOBRIST[color][kind][sq]
+        scores, tables = self._score[color], _SQUARE_SCORES[color][kind]
+        scores[OPENING] += tables[OPENING][sq]
+        scores[LATER] += tables[LATER][sq]
+
+    def _clear(self, color: int, kind: int, sq: int) -> None:
+        self._bb[color][kind] &= ~(1 << sq)
+        self._occupied[color] &= ~(1 << sq)
+        self._mailbox[sq] = None
+        self.zobrist ^= _ZOBRIST[color][kind][sq]
+        scores, tables = self._score[color], _SQUARE_SCORES[color][kind]
+        scores[OPENING] -= tables[OPENING][sq]
+        scores[LATER] -= tables[LATER][sq]
+
+    # ---------- Attacks ----------
+
+    def attacked(self, sq: int, by_white: bool) -> bool:
+        """Returns True iff square sq is attacked by any piece of colour by_white."""
+        color = int(by_white)
+        bb = self._bb[color]
+        occupied = self._occupied[0] | self._occupied[1]
+        if KNIGHT_ATTACKS[sq] & bb[KNIGHT] or KING_ATTACKS[sq] & bb[KING]:
+            return True
+        if PAWN_ATTACKS[color ^ 1][sq] & bb[PAWN]:
+            return True
+        if rook_attacks(sq, occupied) & (bb[ROOK] | bb[QUEEN]):
+            return True
+        return bishop_attacks(sq, occupied) & (bb[BISHOP] | bb[QUEEN]) != 0
+
+    def king_square(self, white: bool) -> int:
+        return self._bb[int(white)][KING].bit_length() - 1
+
+    def is_in_check(self, file_rank: Tuple[int, int] = None, color: bool = None) -> bool:
+        """Returns True iff King is in check, or hypothetical square file_rank (assuming same color king)."""
+        if color is None:
+            color = self.turn
+        if file_rank is None:
+            sq = self.king_square(color)
+        else:
+            sq = square_index(*file_rank)
+        return self.attacked(sq, not color)
+
+    # ---------- Move generation ----------
+
+    def pseudo_legal_moves(self) -> List[int]:
+        """Returns the encoded moves of the side to move, ignoring whether they leave the king in check."""
+        color = int(self.turn)
+        bb = self._bb[color]
+        ours, theirs = self._occupied[color], self._occupied[color ^ 1]
+        occupied = ours | theirs
+        targets = ~ours
+        out = []
+
+        # Pawns:
+        forward = 8 if color else -8
+        promotion_rank = 8 if color else 1
+        for sq in squares_of(bb[PAWN]):
+            to = sq + forward
+            if not occupied >> to & 1:
+                if to // 8 + 1 == promotion_rank:
+                    out.append(encode_move(sq, to, PROMOTION))
+                else:
+                    out.append(encode_move(sq, to))
+                    if sq // 8 + 1 == (2 if color else 7) and not occupied >> (to + forward) & 1:
+                        out.append(encode_move(sq, to + forward, DOUBLE_PUSH))
+            for to in squares_of(PAWN_ATTACKS[color][sq] & theirs):
+                out.append(encode_move(sq, to, PROMOTION if to // 8 + 1 == promotion_rank else NORMAL))
+        if self.en_passant is not None:
+            target = square_index(self.en_passant, 6 if color else 3)
+            for sq in squares_of(PAWN_ATTACKS[color ^ 1][target] & bb[PAWN]):
+                out.append(encode_move(sq, target, EN_PASSANT))
+
+        # Pieces:
+        for sq in squares_of(bb[KNIGHT]):
+            for to in squares_of(KNIGHT_ATTACKS[sq] & targets):
+                out.append(encode_move(sq, to))
+        for sq in squares_of(bb[BISHOP] | bb[QUEEN]):
+            for to in squares_of(bishop_attacks(sq, occupied) & targets):
+                out.append(encode_move(sq, to))
+        for sq in squares_of(bb[ROOK] | bb[QUEEN]):
+            for to in squares_of(rook_attacks(sq, occupied) & targets):
+                out.append(encode_move(sq, to))
+        for sq in squares_of(bb[KING]):
+            for to in squares_of(KING_ATTACKS[sq] & targets):
+                out.append(encode_move(sq, to))
+
+        # Castling:
+        rank = 1 if color else 8
+        kingside, queenside = (WHITE_KINGSIDE, WHITE_QUEENSIDE) if color else (BLACK_KINGSIDE, BLACK_QUEENSIDE)
+        e, f, g = square_index(5, rank), square_index(6, rank), square_index(7, rank)
+        b, c, d = square_index(2, rank), square_index(3, rank), square_index(4, rank)
+        if self.castling & (kingside | queenside) and not self.attacked(e, not color):
+            if self.castling & kingside and not occupied & (1 << f | 1 << g) \
+                    and not self.attacked(f, not color) and not self.attacked(g, not color):
+                out.append(encode_move(e, g, CASTLE))
+            if self.castling & queenside and not occupied & (1 << b | 1 << c | 1 << d) \
+                    and not self.attacked(d, not color) and not self.attacked(c, not color):
+                out.append(encode_move(e, c, CASTLE))
+        return out
+
+    def legal_moves(self) -> List[int]:
+        """
+        Returns the encoded legal moves of the side to move.
+        The list is cached until the next make_move / unmake_move; callers get their own copy.
+        """
+        if self._moves_cache is None:
+            pins, evasions = self.move_constraints()
+            self._moves_cache = [m for m in self.pseudo_legal_moves() if self._is_legal(m, pins, evasions)]
+        return list(self._moves_cache)
+
+    def move_constraints(self, color: bool = None) -> Tuple[Dict[int, int], Optional[int]]:
+        """
+        Returns (pins, evasions) for the king of color (default: the side to move), like Board.move_constraints
+        but with masks: pins maps the square of each pinned piece to the mask of squares it can move to, and
+        evasions is None if the king isn't in check, and otherwise the mask of squares a piece other than the
+        king must move to (0 in double check).
+        """
+        if color is None:
+            color = self.turn
+        color = int(color)
+        king = self.king_square(color)
+        theirs = self._bb[color ^ 1]
+        ours, occupied = self._occupied[color], self._occupied[0] | self._occupied[1]
+        checkers = KNIGHT_ATTACKS[king] & theirs[KNIGHT] | PAWN_ATTACKS[color][king] & theirs[PAWN]
+        evasions = checkers
+        pins = {}
+        for rays, sliders in ((_ROOK_RAYS, theirs[ROOK] | theirs[QUEEN]),
+                              (_BISHOP_RAYS, theirs[BISHOP] | theirs[QUEEN])):
+            for ray, positive, table in rays[king]:
+                if not ray & sliders:
+                    continue
+                blockers = ray & occupied
+                first = _nearest(blockers, positive)
+                if sliders >> first & 1:
+                    checkers |= 1 << first
+                    evasions |= ray ^ table[first]
+                elif ours >> first & 1 and blockers ^ 1 << first:
+                    second = _nearest(blockers ^ 1 << first, positive)
+                    if sliders >> second & 1:
+                        pins[first] = ray ^ table[second]
+        if not checkers:
+            return pins, None
+        if checkers & checkers - 1:
+            return pins, 0
+        return pins, evasions
+
+    def _is_legal(self, m: int, pins: Dict[int, int], evasions: Optional[int]) -> bool:
+        """
+        Returns True iff the pseudo-legal move m does not leave the mover's king in check, given the
+        move_constraints of the position. King moves and en passant, which can uncover an attack the
+        constraints don't see, are checked by playing them.
+        """
+        from_sq, to_sq = m & 63, m >> 6 & 63
+        if m >> 12 == EN_PASSANT or self._mailbox[from_sq][1] == KING:
+            color = self.turn
+            self.make_move(m)
+            legal = not self.attacked(self.king_square(color), not color)
+            self.unmake_move()
+            return legal
+        if evasions is not None and not evasions >> to_sq & 1:
+            return False
+        return from_sq not in pins or pins[from_sq] >> to_sq & 1 == 1
+
+    def moves_to(self, file: int, rank: int) -> List[int]:
+        """
+        Returns the encoded legal moves to (file, rank). Unless legal_moves is cached, only the pseudo-legal
+        moves to that square are checked for legality, which is much cheaper than generating all legal moves.
+        """
+        sq = square_index(file, rank)
+        if self._moves_cache is not None:
+            return [m for m in self._moves_cache if m >> 6 & 63 == sq]
+        pins, evasions = self.move_constraints()
+        return [m for m in self.pseudo_legal_moves() if m >> 6 & 63 == sq and self._is_legal(m, pins, evasions)]
+
+    def move_squares(self, m: int) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        """Returns the (old, new) coordinates of the encoded move m, like the moves of Board.legal_moves."""
+        from_sq, to_sq = m & 63, m >> 6 & 63
+        return (from_sq % 8 + 1, from_sq // 8 + 1), (to_sq % 8 + 1, to_sq // 8 + 1)
+
+    def move_types(self, m: int) -> Tuple[type, Optional[type]]:
+        """Returns the type of the piece making move m and the type of the piece it captures (None if none)."""
+        if m >> 12 == EN_PASSANT:
+            return Pawn, Pawn
+        captured = self._mailbox[m >> 6 & 63]
+        return KINDS[self._mailbox[m & 63][1]], KINDS[captured[1]] if captured is not None else None
+
+    def moves_from(self, file: int, rank: int) -> List[Tuple[int, int]]:
+        """Returns the squares the piece on (file, rank) can legally move to."""
+        sq = square_index(file, rank)
+        return [((m >> 6 & 63) % 8 + 1, (m >> 6 & 63) // 8 + 1) for m in self.legal_moves() if m & 63 == sq]
+
+    def make_move(self, m: int) -> None:
+        """Plays the encoded move m without checking legality. Undo with unmake_move."""
+        from_sq, to_sq, flag = m & 63, m >> 6 & 63, m >> 12
+        color, kind = self._mailbox[from_sq]
+        captured = self._mailbox[to_sq]
+        captured_sq = to_sq
+        if flag == EN_PASSANT:
+            captured_sq = to_sq - 8 if color else to_sq + 8
+            captured = self._mailbox[captured_sq]
+        self._history.append((m, kind, captured, captured_sq, self.castling, self.en_passant, self.moves_made,
+                              self.halfmove_clock, self.zobrist))
+        self.position_history.append(self.zobrist)
+        self._moves_cache, self._status_cache = None, None
+
+        if captured is not None:
+            self._clear(captured[0], captured[1], captured_sq)
+        self._clear(color, kind, from_sq)
+        self._set(color, QUEEN if flag == PROMOTION else kind, to_sq)
+        if flag == CASTLE:
+            if to_sq > from_sq:
+                self._clear(color, ROOK, to_sq + 1)
+                self._set(color, ROOK, to_sq - 1)
+            else:
+                self._clear(color, ROOK, to_sq - 2)
+                self._set(color, ROOK, to_sq + 1)
+
+        castling = self.castling
+        self.castling &= _CASTLE_MASK[from_sq] & _CASTLE_MASK[to_sq]
+        self.zobrist ^= ZOBRIST_CASTLING[castling] ^ ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_BLACK_TO_MOVE
+        if self.en_passant is not None:
+            self.zobrist ^= ZOBRIST_EN_PASSANT[self.en_passant]
+        self.en_passant = from_sq % 8 + 1 if flag == DOUBLE_PUSH else None
+        if self.en_passant is not None:
+            self.zobrist ^= ZOBRIST_EN_PASSANT[self.en_passant]
+        self.moves_made += color
+        if kind == PAWN or captured is not None:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        self.turn = not self.turn
+
+    def unmake_move(self) -> None:
+        """Takes back the last move played with make_move."""
+        m, kind, captured, captured_sq, self.castling, self.en_passant, self.moves_made, self.halfmove_clock, \
+            zobrist = self._history.pop()
+        self.position_history.pop()
+        self._moves_cache, self._status_cache = None, None
+        from_sq, to_sq, flag = m & 63, m >> 6 & 63, m >> 12
+        self.turn = not self.turn
+        color = int(self.turn)
+
+        if flag == CASTLE:
+            if to_sq > from_sq:
+                self._clear(color, ROOK, to_sq - 1)
+                self._set(color, ROOK, to_sq + 1)
+            else:
+                self._clear(color, ROOK, to_sq + 1)
+                self._set(color, ROOK, to_sq - 2)
+        self._clear(color, QUEEN if flag == PROMOTION else kind, to_sq)
+        self._set(color, kind, from_sq)
+        if captured is not None:
+            self._set(captured[0], captured[1], captured_sq)
+        self.zobrist = zobrist
+
+    def move(self, old: Union[BitPiece, Piece, str, Tuple[int, int]], new: Union[str, Tuple[int, int]]) -> bool:
+        """Returns True iff move is successful. Takes the same arguments as Board.move."""
+        if isinstance(old, (BitPiece, Piece)):
+            old = (old.file, old.rank)
+        elif type(old) is str:
+            old = human_in(old)
+        if type(new) is str:
+            new = human_in(new)
+        from_sq, to_sq = square_index(*old), square_index(*new)
+        for m in self.legal_moves():
+            if m & 63 == from_sq and m >> 6 & 63 == to_sq:
+                self.make_move(m)
+                return True
+        return False
+
+    # ---------- Board interface ----------
+
+    def occupant(self, file: int, rank: int = None) -> Optional[BitPiece]:
+        """
+        Returns piece occupying a square, or None if square is empty or not on board.
+        """
+        if rank is None:
+            file, rank = file
+        if not (0 < file < 9 and 0 < rank < 9):
+            return None
+        entry = self._mailbox[square_index(file, rank)]
+        if entry is None:
+            return None
+        return BitPiece(file, rank, bool(entry[0]), self, entry[1])
+
+    def piece_count(self) -> int:
+        """Returns the number of pieces on the board, kings included."""
+        return bin(self._occupied[0] | self._occupied[1]).count('1')
+
+    def pieces(self, color: bool = None) -> List[BitPiece]:
+        if color is None:
+            return self.white_pieces() + self.black_pieces()
+        out = []
+        for kind in (KING, QUEEN, ROOK, KNIGHT, BISHOP, PAWN):
+            for sq in squares_of(self._bb[int(color)][kind]):
+                out.append(BitPiece(sq % 8 + 1, sq // 8 + 1, color, self, kind))
+        return out
+
+    def white_pieces(self) -> List[BitPiece]:
+        return self.pieces(True)
+
+    def black_pieces(self) -> List[BitPiece]:
+        return self.pieces(False)
+
+    def turn_pieces(self) -> List[BitPiece]:
+        """Returns black_pieces or white_pieces depending on whose turn it is."""
+        return self.pieces(self.turn)
+
+    def opponent_pieces(self) -> List[BitPiece]:
+        """Returns black_pieces or white_pieces depending on whose turn it isn't."""
+        return self.pieces(not self.turn)
+
+    def return_king(self, color: bool = None) -> Optional[BitPiece]:
+        """Returns the King of specified color"""
+        if color is None:
+            color = self.turn
+        if not self._bb[int(color)][KING]:
+            return None
+        sq = self.king_square(color)
+        return BitPiece(sq % 8 + 1, sq // 8 + 1, color, self, KING)
+
+    def check_if_playable(self) -> bool:
+        """Checks if the board has 1 king of each color and updates & returns self.is_playable"""
+        self.is_playable = all(bin(self._bb[color][KING]).count('1') == 1 for color in (0, 1))
+        return self.is_playable
+
+    def status(self) -> int:
+        """Returns the status of the position, cached like legal_moves (see Board.status)."""
+        if self._status_cache is None:
+            self._status_cache = position_status(self)
+        return self._status_cache
+
+    def is_checkmate(self) -> bool:
+        """Returns True iff checkmate."""
+        return self.status() == CHECKMATE
+
+    def is_stalemate(self) -> bool:
+        """Returns True iff stalemate."""
+        return self.status() == STALEMATE
+
+    def repetitions(self) -> int:
+        """Returns how many times the current position occurred before in the game (see Board.repetitions)."""
+        return self.position_history[-2:-self.halfmove_clock - 1:-2].count(self.zobrist)
+
+    def is_repetition(self) -> bool:
+        """Returns True iff threefold repetition."""
+        return self.repetitions() >= 2
+
+    def moves_played(self) -> List[int]:
+        """Returns the moves played on this board (and the board it was copied from), oldest first."""
+        return [record[0] for record in self._history]
+
+    def is_insufficient(self) -> bool:
+        """Returns True iff draw by insufficient material."""
+        n = bin(self._occupied[0] | self._occupied[1]).count('1')
+        if n >= 5:
+            return False
+        if n == 2:
+            return True
+        minors = [bb[KNIGHT] | bb[BISHOP] for bb in self._bb]
+        if n == 3:
+            return (minors[0] | minors[1]) != 0
+        bishops = [bb[BISHOP] for bb in self._bb]
+        if bishops[0] and bishops[1]:
+            b, w = bishops[0].bit_length() - 1, bishops[1].bit_length() - 1
+            return (b % 8 + b // 8) % 2 == (w % 8 + w // 8) % 2
+        return False
+
+    def phase(self) -> int:
+        """Returns the game phase (OPENING or LATER) whose piece-square tables apply."""
+        return OPENING if self.moves_made <= OPENING_MOVES else LATER
+
+    def points(self, color: bool = None) -> float:
+        """Returns total material plus piece-square points of a given player."""
+        if color is None:
+            color = self.turn
+        return self._score[color][self.phase()] / 100
+
+    def value(self, color: bool = None) -> float:
+        """Returns the material and piece-square balance in constant time, like Board.value."""
+        if color is None:
+            color = self.turn
+        phase = self.phase()
+        return (self._score[color][phase] - self._score[not color][phase]) / 100
+
+    def __str__(self) -> str:
+        out = ""
+        for rank in range(8, 0, -1):
+            for file in range(1, 9):
+                entry = self._mailbox[square_index(file, rank)]
+                if entry is None:
+                    out += ' '
+                elif entry[0]:
+                    out += _SYMBOLS[entry[1]]
+                else:
+                    out += ',' if entry[1] == PAWN else _SYMBOLS[entry[1]].lower()
+                out += ' '
+            out = out[:-1] + '\n'
+        if not self.check_if_playable():
+            return out + "BOARD NOT PLAYABLE."
+        return out + status_text(self)
+
+    def __eq__(self, other) -> bool:
+        if self.turn != other.turn:
+            return False
+        for f in range(1, 9):
+            for r in range(1, 9):
+                a, b = self.occupant(f, r), other.occupant(f, r)
+                if (a is None) != (b is None):
+                    return False
+                if a is not None and (a.type is not b.type or a.white != b.white):
+                    return False
+        return True
+
+
+BACKENDS = {
+    'object':   Board,
+    'bitboard': BitBoard,
+}
+
+
+def new_board(backend: str = 'object') -> Union[Board, BitBoard]:
+    """Returns a new board ready for play, using the named backend from BACKENDS."""
+    return BACKENDS[backend]()
+
+
+def backend_of(b: Union[Board, BitBoard]) -> str:
+    """Returns the name of the backend in BACKENDS that b is a board of."""
+    for name, cls in BACKENDS.items():
+        if isinstance(b, cls):
+            return name
+    raise Exception("Unknown board type.")
+
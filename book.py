@@ -0,0 +1,155 @@
+from pgn import *
+import argparse
+import mmap
+import os
+import random
+import struct
+import time
+
+
+# A book is a file of records sorted by position, each (Zobrist hash of the position, move, weight), where the
+# move is from_square | to_square << 6 (square_index of each) and the weight is how often it was played.
+RECORD = struct.Struct('<QHH')
+# The book the bot plays from, if it exists; next to this module, so it is found from any working directory.
+BOOK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'book.bin')
+BOOK_PLIES = 20  # build_book only records moves of the first this many plies of each game.
+MAX_WEIGHT = 0xFFFF
+
+
+def build_book(games: Iterable[PGNGame], path: str, plies: int = BOOK_PLIES, min_count: int = 1) -> Tuple[int, int]:
+    """
+    Writes the book of the first plies moves of games to path, leaving out moves played fewer than
+    min_count times from their position. Games with moves that cannot be replayed are skipped from that move on.
+    Returns the number of games read and the number of records written.
+    """
+    counts = {}
+    n = 0
+    for game in games:
+        n += 1
+        try:
+            for ply, (b, m) in enumerate(game.replay('bitboard')):
+                if ply >= plies:
+                    break
+                key = (b.zobrist, m & 0xFFF)
+                counts[key] = counts.get(key, 0) + 1
+        except Exception:
+            continue
+    records = sorted((zobrist, move, min(count, MAX_WEIGHT)) for (zobrist, move), count in counts.items()
+                     if count >= min_count)
+    with open(path, 'wb') as f:
+        f.write(b''.join(RECORD.pack(*record) for record in records))
+    return n, len(records)
+
+
+class OpeningBook:
+    """
+    A book file, memory-mapped so it is not read into memory; positions are looked up by binary search.
+    """
+    path:   str
+    _file:  Optional[BinaryIO]
+    _map:   Optional[mmap.mmap]
+    _size:  int  # Number of records.
+
+    def __init__(self, path: str = BOOK_FILE):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._size = os.fstat(self._file.fileno()).st_size // RECORD.size
+        # An empty file cannot be mapped, but is a valid (empty) book.
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._size else None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    def entries(self, zobrist: int) -> List[Tuple[int, int, int]]:
+        """Returns (from square, to square, weight) of each book move of the position with hash zobrist."""
+        lo, hi = 0, self._size
+        while lo < hi:  # Finds the first record of the position, if any.
+            mid = (lo + hi) // 2
+            if RECORD.unpack_from(self._map, mid * RECORD.size)[0] < zobrist:
+                lo = mid + 1
+            else:
+                hi = mid
+        out = []
+        for i in range(lo, self._size):
+            key, move, weight = RECORD.unpack_from(self._map, i * RECORD.size)
+            if key != zobrist:
+                break
+            out.append((move & 63, move >> 6, weight))
+        return out
+
+    def moves(self, b: Union[Board, BitBoard]) -> List[Tuple[object, int]]:
+        """
+        Returns the book moves of b, in the board's own move format, with their weights.
+        Moves that are not legal on b (after a hash collision) are left out.
+        """
+        out = []
+        for from_sq, to_sq, weight in self.entries(b.zobrist):
+            old = (from_sq % 8 + 1, from_sq // 8 + 1)
+            for m in b.moves_to(to_sq % 8 + 1, to_sq // 8 + 1):
+                if b.move_squares(m)[0] == old and weight > 0:
+                    out.append((m, weight))
+        return out
+
+    def choose(self, b: Union[Board, BitBoard], rng: random.Random = random) -> Optional[object]:
+        """Returns a book move of b chosen at random in proportion to the weights, or None if there is none."""
+        moves = self.moves(b)
+        if not moves:
+            return None
+        return rng.choices([m for m, _ in moves], [weight for _, weight in moves])[0]
+
+
+_books = {}  # The books opened by open_book, by path.
+
+
+def open_book(path: str = BOOK_FILE) -> Optional[OpeningBook]:
+    """
+    Returns the book at path, opening it the first time, or None if there is no such file.
+    A missing file is looked for again on the next call, so a book built meanwhile is picked up.
+    """
+    if path not in _books:
+        if not os.path.exists(path):
+            return None
+        _books[path] = OpeningBook(path)
+    return _books[path]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Builds or probes an opening book.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="builds a book from PGN files")
+    build.add_argument('pgn', nargs='+')
+    build.add_argument('--out', default=BOOK_FILE)
+    build.add_argument('--plies', type=int, default=BOOK_PLIES, help="plies of each game to record")
+    build.add_argument('--min-count', type=int, default=1, help="times a move must be played to be recorded")
+    probe = commands.add_parser('probe', help="lists the book moves of a position")
+    probe.add_argument('fen', nargs='?', default=START_FEN,
+                       help="position as written by Board.to_fen, which gives the en passant file after any double push")
+    probe.add_argument('--book', default=BOOK_FILE)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        def read_all() -> Iterator[PGNGame]:
+            for path in args.pgn:
+                with open(path) as f:
+                    yield from read_games(f)
+        start = time.perf_counter()
+        games, records = build_book(read_all(), args.out, args.plies, args.min_count)
+        print(f"{games} games, {records} records ({records * RECORD.size} bytes) written to {args.out} "
+              f"in {time.perf_counter() - start:.2f}s")
+    else:
+        book = OpeningBook(args.book)
+        b = BitBoard.from_fen(args.fen)
+        moves = sorted(book.moves(b), key=lambda entry: -entry[1])
+        total = sum(weight for _, weight in moves)
+        for m, weight in moves:
+            print(f"{san(b, m):<8} {weight:>6}  {100 * weight / total:5.1f}%")
+        n, start = 10000, time.perf_counter()
+        for _ in range(n):
+            book.entries(b.zobrist)
+        elapsed = time.perf_counter() - start
+        print(f"{len(book)} records, {n / elapsed:.0f} lookups/s")
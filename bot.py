@@ -1,4 +1,7 @@
 from main import *  # This also imports everything from main
+from minimax import ParallelSearch
+from concurrent.futures import ProcessPoolExecutor
+from book import BOOK_FILE, open_book
 
 
 def points(b: Board, color: bool = None) -> int:
@@ -15,7 +18,7 @@ def points(b: Board, color: bool = None) -> int:
     }
     out = 0
     for piece in b.pieces(color):
-        out += points_map[type(piece)]
+        out += points_map[piece.type]
     return out
 
 
@@ -24,37 +27,31 @@ def points_diff(b: Board) -> int:
 
 
 class PotentialMove:
-    piece: Piece
-    move: Tuple[int, int]
+    __slots__ = ('move', 'point_diff')
+    move: object  # A move in the board's own move format (see Board.legal_moves).
     point_diff: int
 
-    def __init__(self, piece, new, point_diff=None):
-        self.piece = piece
-        self.new = new
+    def __init__(self, move, point_diff=None):
+        self.move = move
         self.point_diff = point_diff
 
     def __lt__(self, other) -> bool:
         """Compares point differentials"""
         return self.point_diff < other.point_diff
 
-    def old(self) -> Tuple[int, int]:
-        return self.piece.file, self.piece.rank
-
 
 def _alg001(b: Board) -> PotentialMove:
     # ALGORITHM 001: POINT DIFFERENTIAL:
 
     potentials = []
 
-    for piece in b.pieces(b.turn):
-        # print(piece)
-        for move in piece.available_moves():
-            # print(f"    {move}")
-            copy = BoardCopy(b)
-            copy.move(piece, move)
-            if copy.is_checkmate():
-                return PotentialMove(piece, move)
-            potentials.append(PotentialMove(piece, move, points_diff(copy)))
+    for move in b.legal_moves():
+        b.make_move(move)
+        mate, diff = b.is_checkmate(), points_diff(b)
+        b.unmake_move()
+        if mate:
+            return PotentialMove(move)
+        potentials.append(PotentialMove(move, diff))
 
     # print(potentials)
     return max(potentials)
@@ -64,9 +61,29 @@ def _2move(b: Board) -> PotentialMove:
     pass
 
 
-def bot(b: Board) -> None:
-    """This is the function where the bot makes the move. Nothing is returned; rather, the board is taken as
-    an argument and the bot makes its move on that board."""
+_pools = {}  # The process pools of _alg002, by number of workers, kept alive between moves.
+
 
-    b.move(_alg001(b).old(), _alg001(b).new)
+def _alg002(b: Board, depth: int, workers: int) -> object:
+    # ALGORITHM 002: ALPHA-BETA SEARCH, WITH THE ROOT MOVES SPLIT ACROSS worker PROCESSES:
+    # The pool is reused, so the workers (and their transposition tables) outlive each move.
+    if workers not in _pools:
+        _pools[workers] = ProcessPoolExecutor(workers)
+    return ParallelSearch(b, depth, workers, _pools[workers]).best_move()
+
+
+def bot(b: Board, workers: int = None, depth: int = 2, book: Optional[str] = BOOK_FILE) -> None:
+    """This is the function where the bot makes the move. Nothing is returned; rather, the board is taken as
+    an argument and the bot makes its move on that board.
+    If the position is in the opening book at path book (None for no book), a book move is played.
+    If workers is given, the bot searches depth moves ahead using that many processes (ALGORITHM 002)."""
+
+    opening_book = open_book(book) if book is not None else None
+    book_move = opening_book.choose(b) if opening_book is not None else None
+    if book_move is not None:
+        b.make_move(book_move)
+    elif workers is None:
+        b.make_move(_alg001(b).move)
+    else:
+        b.make_move(_alg002(b, depth, workers))
 
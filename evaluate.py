@@ -0,0 +1,182 @@
+from bitboard import *
+import argparse
+import numpy as np
+import random
+import sys
+import time
+from typing import *
+
+
+# Plane p of a packed position holds the pieces of PLANES[p] == (kind, white): white's 6 kinds, then black's.
+PLANES = [(kind, white) for white in (True, False) for kind in range(6)]
+
+# WEIGHTS[phase, p, sq] is the score (for white) of a piece of PLANES[p] on sq, so a position's score is
+# the sum of its planes multiplied by these. Same values as SQUARE_SCORES, in centipawns.
+WEIGHTS = np.array([[[SQUARE_SCORES[KINDS[kind], white][phase][sq] * (1 if white else -1) for sq in range(64)]
+                     for kind, white in PLANES] for phase in (OPENING, LATER)], dtype=np.int32)
+# The weights as a (12 * 64) x 2 float32 matrix, so values() can use BLAS; the integer sums are still exact.
+_WEIGHT_MATRIX = WEIGHTS.reshape(2, 12 * 64).T.astype(np.float32)
+# The plane of each FEN piece letter.
+_PLANE_OF_SYMBOL = {(symbol if white else symbol.lower()): KIND_OF[cls] + 6 * (not white)
+                    for cls, symbol in PIECES.items() for white in (True, False)}
+CHUNK = 8192  # Positions converted to float32 and multiplied at a time, to stay within the CPU cache.
+
+
+class PositionBatch:
+    """
+    N positions packed for evaluation with NumPy.
+    planes[i, p, sq] is 1 iff position i has a piece of PLANES[p] on sq == square_index(file, rank).
+
+    Batches only pay off for positions that are not on boards yet, such as FEN strings or arrays of bitboards:
+    Board.value() is kept up to date incrementally, so calling it on each board is faster than even packing
+    the boards into a batch.
+    """
+    planes: np.ndarray  # N x 12 x 64 uint8.
+    turn:   np.ndarray  # N bools, True iff white is to move.
+    phase:  np.ndarray  # N ints, the game phase (OPENING or LATER) of each position.
+
+    def __init__(self, bitboards: List[List[int]], turns: List[bool], moves_made: List[int]):
+        """
+        Packs N positions given as their 12 piece bitboards (ordered like PLANES), the side to move and
+        Board.moves_made of each position.
+        """
+        n = len(bitboards)
+        words = np.array(bitboards, dtype='<u8').reshape(n, 12)
+        bits = np.unpackbits(words.view(np.uint8), axis=1, bitorder='little')
+        self.planes = bits.reshape(n, 12, 64)
+        self.turn = np.array(turns, dtype=bool).reshape(n)
+        self.phase = np.where(np.array(moves_made, dtype=np.int64).reshape(n) <= OPENING_MOVES, OPENING, LATER)
+
+    def __len__(self) -> int:
+        return len(self.planes)
+
+    @classmethod
+    def from_boards(cls, boards: Iterable[Union[Board, BitBoard]]) -> 'PositionBatch':
+        """Packs the positions of a sequence of boards of either backend."""
+        bitboards, turns, moves_made = [], [], []
+        for b in boards:
+            if isinstance(b, BitBoard):
+                bitboards.append(b._bb[1] + b._bb[0])
+            else:
+                planes = [0] * 12
+                for p in b.pieces():
+                    planes[KIND_OF[p.type] + 6 * (not p.white)] |= 1 << square_index(p.file, p.rank)
+                bitboards.append(planes)
+            turns.append(b.turn)
+            moves_made.append(b.moves_made)
+        return cls(bitboards, turns, moves_made)
+
+    @classmethod
+    def from_fens(cls, fens: Iterable[str]) -> 'PositionBatch':
+        """
+        Packs the positions of a sequence of FEN strings. Only the fields needed for evaluation are read,
+        with less validation than parse_fen.
+        """
+        bitboards, turns, moves_made = [], [], []
+        for fen in fens:
+            fields = fen.split()
+            planes = [0] * 12
+            sq = 56  # a8, the first square of the placement field.
+            try:
+                for c in fields[0]:
+                    if c == '/':
+                        sq -= 16
+                    elif c.isdigit():
+                        sq += int(c)
+                    else:
+                        planes[_PLANE_OF_SYMBOL[c]] |= 1 << sq
+                        sq += 1
+                turn = fields[1] == 'w'
+                fullmove = int(fields[5]) if len(fields) > 5 else 1
+            except (KeyError, IndexError, ValueError):
+                raise Exception(f"Invalid FEN: {fen}")
+            if sq != 8:
+                raise Exception(f"Invalid FEN: {fen}")
+            bitboards.append(planes)
+            turns.append(turn)
+            moves_made.append(fullmove - int(turn))
+        return cls(bitboards, turns, moves_made)
+
+    def values(self) -> np.ndarray:
+        """
+        Returns the N values of the positions, equal to Board.value() of each: material plus piece-square
+        balance from the point of view of the side to move.
+        """
+        n = len(self)
+        planes = self.planes.reshape(n, 12 * 64)
+        scores = np.empty((n, 2), dtype=np.float32)  # White's score in each phase.
+        for i in range(0, n, CHUNK):
+            np.matmul(planes[i:i + CHUNK].astype(np.float32), _WEIGHT_MATRIX, out=scores[i:i + CHUNK])
+        white_score = np.rint(scores[np.arange(n), self.phase]).astype(np.int64)
+        return np.where(self.turn, white_score, -white_score) / 100
+
+
+def batch_values(positions: Iterable[Union[Board, BitBoard, str]]) -> np.ndarray:
+    """
+    Returns Board.value() of each of a sequence of boards or FEN strings, evaluated together.
+    For boards this is slower than calling value() on each (see PositionBatch); it is much faster than setting
+    up a board from each FEN string.
+    """
+    positions = list(positions)
+    if positions and isinstance(positions[0], str):
+        return PositionBatch.from_fens(positions).values()
+    return PositionBatch.from_boards(positions).values()
+
+
+def random_positions(n: int, seed: int = 0) -> List[BitBoard]:
+    """Returns n positions from random games, for checks and benchmarks."""
+    rng = random.Random(seed)
+    out = []
+    while len(out) < n:
+        b = BitBoard()
+        for _ in range(rng.randrange(120)):
+            moves = b.legal_moves()
+            if not moves:
+                break
+            b.make_move(rng.choice(moves))
+            out.append(b.copy())
+    return out[:n]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Batch evaluation check and benchmark.")
+    parser.add_argument('-n', type=int, default=2000, help="number of distinct random positions")
+    parser.add_argument('--repeat', type=int, default=100, help="times each position is repeated in the batch")
+    args = parser.parse_args()
+
+    boards = random_positions(args.n)
+    fens = [b.to_fen() for b in boards]
+    expected = [b.value() for b in boards]
+    passed = list(batch_values(boards)) == expected and list(batch_values(fens)) == expected and \
+        list(batch_values([Board.from_fen(f) for f in fens])) == expected
+    print("values match Board.value" if passed else "VALUES DIFFER FROM Board.value")
+
+    t = time.perf_counter()
+    for b in boards:
+        b.value()
+    t = time.perf_counter() - t
+    print(f"Board.value:   {len(boards) / t:>12.0f} positions/s")
+
+    t = time.perf_counter()
+    for fen in fens:
+        Board.from_fen(fen).value()
+    t = time.perf_counter() - t
+    print(f"Board.from_fen + value: {len(fens) / t:>9.0f} positions/s")
+
+    batch = PositionBatch.from_boards(boards * args.repeat)
+    t = time.perf_counter()
+    batch.values()
+    t = time.perf_counter() - t
+    print(f"batch values:  {len(batch) / t:>12.0f} positions/s, already packed ({len(batch)} positions)")
+    for name, source, pack in (("from_boards", boards, PositionBatch.from_boards),
+                               ("from_fens", fens, PositionBatch.from_fens)):
+        t = time.perf_counter()
+        pack(source)
+        packed = time.perf_counter() - t
+        t = time.perf_counter()
+        batch_values(source)
+        evaluated = time.perf_counter() - t
+        print(f"{name + ':':<14} {len(source) / packed:>12.0f} positions/s packed, "
+              f"{len(source) / evaluated:.0f} positions/s packed and evaluated")
+    print("OK" if passed else "FAILED")
+    sys.exit(0 if passed else 1)
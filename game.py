@@ -1,8 +1,14 @@
 import pygame as pg
+import datetime
 import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from main import *
 from typing import *
 from minimax import *
+from bitboard import *
+from pgn import *
+from book import BOOK_FILE, OpeningBook, open_book
 
 
 pg.init()
@@ -10,6 +16,13 @@ pg.init()
 PIECE_DIMENSION, SQUARE_DIMENSION = 300, 350
 LIGHT_SQUARE, DARK_SQUARE = "icons/light_square.png", "icons/dark_square.png"
 CAPTURE, MOVE_TO, CHECK = "icons/capture.png", "icons/move_to.png", "icons/check.png"
+BACKEND = 'object'  # Board backend to play on; one of the keys of bitboard.BACKENDS.
+BOT_DEPTH = 2  # Search depth of the bot in ChessGame.run.
+BOT_WORKERS = 1  # Processes the bot's search is split across in ChessGame.run; 1 searches on a thread only.
+FPS = 30  # Most frames ChessGame.loop draws per second.
+BOT_DONE = pg.USEREVENT  # Posted by a BotSearch when it has finished.
+BOT_BOOK = BOOK_FILE  # Opening book the bot plays from while it has moves for the position; None disables.
+PGN_FILE = 'games.pgn'  # Every game played is appended to this file when the window is closed; None disables.
 
 
 def make_image(icon_file: str, width: int, height: int) -> pg.surface:
@@ -21,20 +34,122 @@ def make_image(icon_file: str, width: int, height: int) -> pg.surface:
     return pg.transform.scale(pic, (width, height))
 
 
+# The icons of the board, by key: pieces by (class, white), and the square tiles and markers by name.
+ICON_FILES = {
+    (King,   True):  'icons/white_king.png',
+    (Queen,  True):  'icons/white_queen.png',
+    (Rook,   True):  'icons/white_rook.png',
+    (Bishop, True):  'icons/white_bishop.png',
+    (Knight, True):  'icons/white_knight.png',
+    (Pawn,   True):  'icons/white_pawn.png',
+    (King,   False): 'icons/black_king.png',
+    (Queen,  False): 'icons/black_queen.png',
+    (Rook,   False): 'icons/black_rook.png',
+    (Bishop, False): 'icons/black_bishop.png',
+    (Knight, False): 'icons/black_knight.png',
+    (Pawn,   False): 'icons/black_pawn.png',
+    'light':   LIGHT_SQUARE,
+    'dark':    DARK_SQUARE,
+    'capture': CAPTURE,
+    'move_to': MOVE_TO,
+    'check':   CHECK,
+}
+_atlases = {}      # icon_atlas of each size.
+_backgrounds = {}  # board_background of each size and side_up.
+
+
+def icon_atlas(size: int) -> Tuple[pg.Surface, Dict[object, pg.Rect]]:
+    """
+    Returns one surface holding all the icons of ICON_FILES, scaled to size x size, and the area of each
+    icon on it. The icons are loaded once per size, and only after the display has been set up.
+    """
+    if size not in _atlases:
+        atlas = pg.Surface((size * len(ICON_FILES), size), pg.SRCALPHA)
+        areas = {}
+        for i, (key, icon_file) in enumerate(ICON_FILES.items()):
+            areas[key] = pg.Rect(i * size, 0, size, size)
+            atlas.blit(make_image(icon_file, size, size), areas[key])
+        _atlases[size] = atlas.convert_alpha(), areas
+    return _atlases[size]
+
+
+def board_background(size: int, side_up: bool) -> pg.Surface:
+    """Returns the empty board with squares of size x size, oriented for side_up (see ChessGame.draw)."""
+    if (size, side_up) not in _backgrounds:
+        atlas, areas = icon_atlas(size)
+        background = pg.Surface((8 * size, 8 * size))
+        for x in range(8):
+            for y in range(8):
+                light = (x + y) % 2 == (0 if side_up else 1)
+                background.blit(atlas, (x * size, y * size), areas['light' if light else 'dark'])
+        _backgrounds[size, side_up] = background.convert()
+    return _backgrounds[size, side_up]
+
+
+class BotSearch(threading.Thread):
+    """
+    Searches a copy of a board on a worker thread, so the UI can keep handling events meanwhile.
+    If the position is in book, a book move is played instead of searching.
+    With more than one worker, the search is split across the processes of pool (see ParallelSearch).
+    move is the best move found, in the board's own move format, once the thread has finished, which it
+    signals by posting a BOT_DONE event.
+    """
+    move:   Optional[object]
+    _board: Board
+    _depth: int
+    _workers: int
+    _pool:  Optional[ProcessPoolExecutor]
+    _book:  Optional[OpeningBook]
+    _cancelled: threading.Event
+
+    def __init__(self, board: Board, depth: int, workers: int = 1, pool: ProcessPoolExecutor = None,
+                 book: OpeningBook = None):
+        super().__init__(daemon=True)
+        self._board = board.copy()
+        self._depth = depth
+        self._workers = workers
+        self._pool = pool
+        self._book = book
+        self._cancelled = threading.Event()
+        self.move = None
+        self.start()
+
+    def run(self) -> None:
+        try:
+            if self._book is not None:
+                self.move = self._book.choose(self._board)
+                if self.move is not None:
+                    return
+            if self._workers > 1:
+                search = ParallelSearch(self._board, self._depth, self._workers, self._pool, self._cancelled)
+            else:
+                search = GameState(self._board, self._depth, stop=self._cancelled)
+            self.move = search.best_move()
+        finally:
+            pg.event.post(pg.event.Event(BOT_DONE))
+
+    def cancel(self) -> None:
+        """Stops the search and waits for the thread to finish."""
+        self._cancelled.set()
+        self.join()
+
+
 class ChessGame:
     """The UI for a chess game."""
     square_size:    int
     board:          Board
-    _icon_map:      Dict[Tuple[Piece, bool], str]
-    grid:           Dict[Tuple[int, int], pg.Rect]
+    grid:           Dict[Tuple[int, int], pg.Rect]  # The screen rectangle of each square, as currently drawn.
+    _grids:         Dict[bool, Dict[Tuple[int, int], pg.Rect]]  # grid for each side_up.
+    _drawn:         Dict[Tuple[int, int], tuple]  # What draw last put on each square: (piece, marker) icon keys.
+    _drawn_side:    Optional[bool]                # side_up of the last draw.
     piece_clicked:  Optional[Tuple[int, int]]
+    _bot:           Optional[BotSearch]  # The bot's search while it is thinking.
+    _start:         str                  # FEN of the position the game started from.
     # Icons:
     _screen:        pg.Surface
-    _light_square:  pg.Surface
-    _dark_square:   pg.Surface
-    _capture:       pg.Surface
-    _move_to:       pg.Surface
-    _check:         pg.Surface
+    _atlas:         pg.Surface                    # All icons (see icon_atlas).
+    _areas:         Dict[object, pg.Rect]         # The area of each icon of ICON_FILES on _atlas.
+    _backgrounds:   Dict[bool, pg.Surface]        # The empty board for each side_up.
 
     def __init__(self, square_size: int, board: Board = None):
         if board is None:
@@ -43,200 +158,192 @@ class ChessGame:
             self.board = board
         self.square_size = square_size
         self.piece_clicked = None
-        self.grid = dict()
+        self._bot = None
+        self._start = start_of(self.board)
 
         self._screen = pg.display.set_mode((8 * self.square_size, 8 * self.square_size))
 
-        # a function defined for convenience that we use to set up the
-        # _icon_map below.
-        def load_image(x: str) -> pg.surface:
-            return make_image(x, self.square_size, self.square_size)
-
-        self._light_square, self._dark_square = load_image(LIGHT_SQUARE), load_image(DARK_SQUARE)
-        self._capture, self._move_to, self._check = load_image(CAPTURE), load_image(MOVE_TO), load_image(CHECK)
-
-        self._icon_map = {
-            (King,   True):  load_image('icons/white_king.png'),
-            (Queen,  True):  load_image('icons/white_queen.png'),
-            (Rook,   True):  load_image('icons/white_rook.png'),
-            (Bishop, True):  load_image('icons/white_bishop.png'),
-            (Knight, True):  load_image('icons/white_knight.png'),
-            (Pawn,   True):  load_image('icons/white_pawn.png'),
-            (King,   False): load_image('icons/black_king.png'),
-            (Queen,  False): load_image('icons/black_queen.png'),
-            (Rook,   False): load_image('icons/black_rook.png'),
-            (Bishop, False): load_image('icons/black_bishop.png'),
-            (Knight, False): load_image('icons/black_knight.png'),
-            (Pawn,   False): load_image('icons/black_pawn.png'),
-        }
+        self._atlas, self._areas = icon_atlas(self.square_size)
+        self._backgrounds = {side_up: board_background(self.square_size, side_up) for side_up in (True, False)}
+
+        # The squares' rectangles only depend on the orientation, so they are set up once:
+        self._grids = {}
+        for side_up in (True, False):
+            self._grids[side_up] = {}
+            for x in range(8):
+                for y in range(8):
+                    square = (x + 1, 8 - y) if side_up else (8 - x, y + 1)
+                    self._grids[side_up][square] = pg.Rect(x * self.square_size, y * self.square_size,
+                                                           self.square_size, self.square_size)
+        self.grid = self._grids[True]
+        self._drawn, self._drawn_side = {}, None
 
     def occupant(self, file_rank: Tuple[int, int]) -> Optional[Piece]:
         return self.board.occupant(file_rank)
 
-    def draw(self, side_up: bool) -> None:
+    def draw(self, side_up: bool, highlights: Dict[Tuple[int, int], str] = None) -> None:
         """
         Draw the given board state using pg.
 
         side_up == True means white is playing / on the bottom.
         side_up == False means black is playing / on the bottom.
+        highlights maps squares to the key of a marker icon drawn over them (see draw_click).
+        Only the squares that look different from the last draw are redrawn and updated on the display.
         """
-        for x in range(8):
-            for y in range(8):
-                rectangle = pg.Rect(x * self.square_size,
-                                        y * self.square_size,
-                                        self.square_size, self.square_size)
-                if side_up:
-                    self.grid[(x + 1, y*(-1) + 8)] = rectangle
-                    if (x + y) % 2 == 0:
-                        self._screen.blit(self._light_square, (x * self.square_size, y * self.square_size))
-                    else:
-                        self._screen.blit(self._dark_square, (x * self.square_size, y * self.square_size))
-                    if self.board.occupant(x + 1, y*(-1) + 8) is not None:
-                        c = type(self.board.occupant(x + 1, y*(-1) + 8)), self.board.occupant(x + 1, y*(-1) + 8).white
-                        self._screen.blit(self._icon_map[c], rectangle)
-
-                else:
-                    self.grid[(x*(-1) + 8, y + 1)] = rectangle
-                    if (x + y) % 2 == 1:
-                        self._screen.blit(self._light_square, (x * self.square_size, y * self.square_size))
-                    else:
-                        self._screen.blit(self._dark_square, (x * self.square_size, y * self.square_size))
-                    if self.board.occupant(x*(-1) + 8, y + 1) is not None:
-                        c = type(self.board.occupant(x*(-1) + 8, y + 1)), self.board.occupant(x*(-1) + 8, y + 1).white
-                        self._screen.blit(self._icon_map[c], rectangle)
-
+        self.grid = self._grids[side_up]
+        contents = {}
+        for square in self.grid:
+            piece = self.board.occupant(square)
+            contents[square] = ((piece.type, piece.white) if piece is not None else None, None)
         if self.board.is_in_check():
+            king = self.board.return_king(self.board.turn)
+            contents[king.file, king.rank] = (contents[king.file, king.rank][0], 'check')
+        for square, marker in (highlights or {}).items():
+            contents[square] = (contents[square][0], marker)
 
-            if side_up:
-                y = self.board.return_king(self.board.turn).rank * (-1) + 8
-                x = self.board.return_king(self.board.turn).file - 1
-            else:
-                x = self.board.return_king(self.board.turn).file * (-1) + 8
-                y = self.board.return_king(self.board.turn).rank - 1
-            self._screen.blit(self._check, (x * self.square_size, y * self.square_size))
-        # Update the screen
-        pg.display.flip()
+        if self._drawn_side != side_up:
+            self._drawn = {}
+        dirty = [square for square, content in contents.items() if self._drawn.get(square) != content]
+        background = self._backgrounds[side_up]
+        if not self._drawn:
+            self._screen.blit(background, (0, 0))
+        for square in dirty:
+            rectangle = self.grid[square]
+            piece, marker = contents[square]
+            if self._drawn:
+                self._screen.blit(background, rectangle, rectangle)
+            if piece is not None:
+                self._screen.blit(self._atlas, rectangle, self._areas[piece])
+            if marker is not None:
+                self._screen.blit(self._atlas, rectangle, self._areas[marker])
+        self._drawn, self._drawn_side = contents, side_up
+        # Update the changed part of the screen
+        if dirty:
+            pg.display.update([self.grid[square] for square in dirty])
 
     def draw_click(self, file_rank: Tuple[int, int], side_up: bool) -> None:
-        """Draws the board after a piece has been clicked."""
+        """Draws the board after a piece has been clicked, marking the squares it can move to."""
         if self.occupant(file_rank) is None:
             return None
-        for square in self.occupant(file_rank).available_moves():
-            if side_up:
-                x, y = square[0] - 1, square[1]*(-1) + 8
-            else:
-                x, y = square[0]*(-1) + 8, square[1] - 1
-            if self.board.occupant(square) is None:
-                self._screen.blit(self._move_to, (x * self.square_size, y * self.square_size))
-            else:
-                self._screen.blit(self._capture, (x * self.square_size, y * self.square_size))
-        # Update the screen
-        pg.display.flip()
+        self.draw(side_up, {square: 'move_to' if self.board.occupant(square) is None else 'capture'
+                            for square in self.occupant(file_rank).available_moves()})
 
     def ended(self) -> bool:
         """Returns True iff the game is not over"""
-        return self.board.is_checkmate() or self.board.is_stalemate() or self.board.is_insufficient()
+        return self.board.status() != ONGOING
+
+    def record(self, white: str, black: str) -> None:
+        """Appends the game to PGN_FILE, unless no moves were played."""
+        if PGN_FILE is None or not self.board.moves_played():
+            return
+        tags = {'Event': "chessbot game", 'Site': "?", 'Date': datetime.date.today().strftime('%Y.%m.%d'),
+                'White': white, 'Black': black}
+        with open(PGN_FILE, 'a') as f:
+            write_games([game_of(self.board, tags, self._start)], f)
 
     def end_text(self) -> str:
-        if self.board.is_checkmate():
+        status = self.board.status()
+        if status == CHECKMATE:
             return "CHECKMATE"
-        if self.board.is_stalemate():
+        if status == STALEMATE:
             return "STALEMATE"
-        if self.board.is_insufficient():
+        if status == REPETITION:
+            return "DRAW BY REPETITION"
+        if status == FIFTY_MOVES:
+            return "DRAW BY FIFTY-MOVE RULE"
+        if status == INSUFFICIENT:
             return "DRAW BY INSUFFICIENT MATERIAL"
 
-    def run(self, user_color_or_pov: bool) -> None:
+    def click(self, pos: Tuple[int, int]) -> bool:
+        """
+        Handles a click at pos on the screen: selects the clicked piece if it can move, or moves the selected
+        piece to the clicked square. Returns True iff a move was made.
+        """
+        square = next((square for square, rectangle in self.grid.items() if rectangle.collidepoint(pos)), None)
+        if square is None:
+            return False
+        if self.piece_clicked is not None and self.occupant(self.piece_clicked) is not None and \
+                square in self.occupant(self.piece_clicked).available_moves():
+            self.board.move(self.piece_clicked, square)
+            self.piece_clicked = None
+            return True
+        piece = self.occupant(square)
+        self.piece_clicked = square if piece is not None and piece.available_moves() else None
+        return False
+
+    def loop(self, pov: bool, engine: Callable[[Board], BotSearch] = None) -> None:
+        """
+        Plays the game until the window is closed.
+        pov is the color of the pieces on the bottom of the screen.
+        If engine is given, it plays the other color: it is called with the board to start a search, and the
+        move found is played when it finishes. Otherwise the user plays both colors.
+        The loop sleeps until an event arrives, and only draws when the board changed, at most FPS times a second.
+        """
+        clock = pg.time.Clock()
+        full, changed = True, False
+        if engine is not None and self.board.turn != pov and not self.ended():
+            self._bot = engine(self.board)
+        while True:
+            if full or changed:
+                if full:
+                    self._drawn = {}
+                if self.piece_clicked is not None:
+                    self.draw_click(self.piece_clicked, pov)
+                else:
+                    self.draw(pov)
+                full, changed = False, False
+                clock.tick(FPS)
+
+            for event in [pg.event.wait()] + pg.event.get():
+                if event.type == pg.QUIT:
+                    if self._bot is not None:
+                        self._bot.cancel()
+                        self._bot = None
+                    return
+                if event.type == pg.VIDEOEXPOSE:
+                    full = True
+                # Clicks are ignored while the bot is thinking:
+                elif event.type == pg.MOUSEBUTTONDOWN and event.button == 1 and self._bot is None:
+                    changed = True
+                    # BOT starts thinking here:
+                    if self.click(event.pos) and engine is not None and not self.ended():
+                        self._bot = engine(self.board)
+                # BOT moves here, once its search has finished:
+                elif event.type == BOT_DONE and self._bot is not None:
+                    # The event is posted just before the thread exits.
+                    self._bot.join()
+                    if self._bot.move is not None:
+                        self.board.make_move(self._bot.move)
+                    self._bot = None
+                    changed = True
+
+    def run(self, user_color_or_pov: bool, workers: int = BOT_WORKERS) -> None:
         """
         WITH BOT
         pov is the color of the pieces on the bottom of the screen.
+        workers is the number of processes the bot's search is split across.
         """
         pov = user_color_or_pov  # Just to keep things clean
-        self.draw(pov)
-        if not pov:
-            GameState(self.board, 2).make_best_move()
-            self.draw(pov)
-        running = True
-        while running:
-            for event in pg.event.get():
-                if event.type == pg.QUIT:
-                    running = False
-
-                # If event type is a click:
-                if event.type == pg.MOUSEBUTTONDOWN and event.button == 1:
-    
-                    # Helper function that assigns a coordinate value to c.piece_clicked:
-                    def assign_piece_clicked(c: ChessGame) -> None:
-                        for square in c.grid:
-                            if c.grid[square].collidepoint(event.pos):
-                                if c.occupant(square) is not None and c.occupant(square).available_moves():
-                                    c.piece_clicked = square
-                                    c.draw(pov)
-                                    c.draw_click(square, pov)
-                                else:
-                                    c.draw(pov)
-
-                    if self.piece_clicked is None:
-                        assign_piece_clicked(self)
-                    else:
-                        for square in self.grid:
-                            if self.grid[square].collidepoint(event.pos):
-                                if self.occupant(self.piece_clicked) is not None and \
-                                        square in self.occupant(self.piece_clicked).available_moves():
-                                    self.board.move(self.piece_clicked, square)
-                                    self.draw(pov)
-                                    # BOT moves here:
-                                    if not self.ended():
-                                        GameState(self.board, 2).make_best_move()
-                                        self.draw(pov)
-                                else:
-                                    assign_piece_clicked(self)
-        if not running:
-            pg.quit()
-            sys.exit()
+        pool = ProcessPoolExecutor(workers) if workers > 1 else None
+        book = open_book(BOT_BOOK) if BOT_BOOK is not None else None
+        self.loop(pov, lambda board: BotSearch(board, BOT_DEPTH, workers, pool, book))
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        self.record("Human" if pov else "chessbot", "chessbot" if pov else "Human")
+        pg.quit()
+        sys.exit()
 
     def play(self, user_color_or_pov: bool) -> None:
         """
         WITHOUT BOT
         pov is the color of the pieces on the bottom of the screen.
         """
-        pov = user_color_or_pov  # Just to keep things clean
-        self.draw(pov)
-        running = True
-        while running:
-            for event in pg.event.get():
-                if event.type == pg.QUIT:
-                    running = False
-
-                # If event type is a click:
-                if event.type == pg.MOUSEBUTTONDOWN and event.button == 1:
-
-                    # Helper function that assigns a coordinate value to c.piece_clicked:
-                    def assign_piece_clicked(c: ChessGame) -> None:
-                        for square in c.grid:
-                            if c.grid[square].collidepoint(event.pos):
-                                if c.occupant(square) is not None and c.occupant(square).available_moves():
-                                    c.piece_clicked = square
-                                    c.draw(pov)
-                                    c.draw_click(square, pov)
-                                else:
-                                    c.draw(pov)
-
-                    if self.piece_clicked is None:
-                        assign_piece_clicked(self)
-                    else:
-                        for square in self.grid:
-                            if self.grid[square].collidepoint(event.pos):
-                                if self.occupant(self.piece_clicked) is not None and \
-                                        square in self.occupant(self.piece_clicked).available_moves():
-                                    self.board.move(self.piece_clicked, square)
-                                    self.draw(pov)
-                                else:
-                                    assign_piece_clicked(self)
-        if not running:
-            pg.quit()
-            sys.exit()
+        self.loop(user_color_or_pov)
+        self.record("Human", "Human")
+        pg.quit()
+        sys.exit()
 
 
 if __name__ == '__main__':
-    b = Board()
+    b = new_board(BACKEND)
     ChessGame(75, b).run(True)
@@ -1,4 +1,5 @@
 from typing import Dict, Tuple, List, Optional, Union
+import random
 
 
 def human_in(s: str) -> Tuple[int, int]:
@@ -16,6 +17,11 @@ def in_range(file_rank: Tuple[int, int]) -> bool:
     return file_rank[0] in range(1, 9) and file_rank[1] in range(1, 9)
 
 
+def square_index(file: int, rank: int) -> int:
+    """Returns the index of (file, rank) in Board._squares (a1 == 0, h8 == 63)."""
+    return (rank - 1) * 8 + file - 1
+
+
 
 class Board:
     def occupant(self, file, rank):
@@ -30,12 +36,12 @@ class Move:
     """
     old move; new move. Piece.
     """
+    __slots__ = ('old_file', 'old_rank', 'new_file', 'new_rank', 'piece', 'is_empty_move', 'is_castle_move')
     old_file: int
     old_rank: int
     new_file: int
     new_rank: int
     piece: Piece
-    can_move: bool
     is_empty_move: bool
     is_castle_move: bool
     # promote_to: Optional[object]
@@ -46,11 +52,15 @@ class Move:
         self.new_file = new_file
         self.new_rank = new_rank
         self.piece = piece
-        self.can_move = (new_file, new_rank) in piece.available_moves()
         self.is_empty_move, self.is_castle_move = False, False
         # if isinstance(piece, Pawn) and old_rank == piece.white*5+2:
         #     self.promote_to = promote_to
 
+    @property
+    def can_move(self) -> bool:
+        """Returns True iff the move is available to the piece. Computed on demand, as it generates moves."""
+        return (self.new_file, self.new_rank) in self.piece.available_moves()
+
     def can_en_passant(self) -> Optional[int]:
         if self.is_empty_move or self.is_castle_move:
             return None
@@ -80,12 +90,12 @@ class Move:
 
 class ForcedMove(Move):
     """Forced move, for the Piece.available_moves method."""
+    __slots__ = ()
     old_file: int
     old_rank: int
     new_file: int
     new_rank: int
     piece: Piece
-    can_move: bool
     is_empty_move: bool
     is_castle_move: bool
 
@@ -95,14 +105,18 @@ class ForcedMove(Move):
         self.new_file = new_file_rank[0]
         self.new_rank = new_file_rank[1]
         self.piece = piece
-        self.can_move = True  # Forced
         self.is_empty_move, self.is_castle_move = False, False
 
+    @property
+    def can_move(self) -> bool:
+        return True  # Forced
+
 
 class EmptyMove(Move):
     """
     The 0th move in the move log.
     """
+    __slots__ = ()
     is_empty_move: bool
     is_castle_move: bool
 
@@ -112,6 +126,7 @@ class EmptyMove(Move):
 
 class CastleMove(Move):
     """For castling"""
+    __slots__ = ('color', 'kingside')
     is_empty_move: bool
     is_castle_move: bool
     color: bool
@@ -127,6 +142,7 @@ class Piece:
     A chess piece.
     Files 'a' through 'h' are indicated by 1 through 8 respectively.
     """
+    __slots__ = ('file', 'rank', 'white', 'board', 'type')
     file: int
     rank: int
     white: bool
@@ -157,21 +173,28 @@ class Piece:
         """
         if self.board.turn != self.white:
             return []  # TODO This might mess some stuff up idk
-        out = []
-        for move in self._valid_moves():
-            if not self._will_be_in_check(move):
-                out.append(move)
+        return [new for old, new in self.board.legal_moves() if old == (self.file, self.rank)]
+
+    def _legal_moves(self, pins: Dict[Tuple[int, int], List[Tuple[int, int]]],
+                     evasions: Optional[List[Tuple[int, int]]]) -> List[Tuple[int, int]]:
+        """
+        Filters _valid_moves down to the legal ones, using the pins and check evasions
+        of the position (see Board.move_constraints).
+        """
+        out = self._valid_moves()
+        if evasions is not None:
+            out = [move for move in out if move in evasions]
+        ray = pins.get((self.file, self.rank))
+        if ray is not None:
+            out = [move for move in out if move in ray]
         return out
-        # return [not self._will_be_in_check(move) for move in self._valid_moves()]
 
     def _will_be_in_check(self, new_file_rank: Tuple[int, int]) -> bool:
         """Determines if the board will be in check if a given piece moves to the inputted square."""
-        file, rank = new_file_rank
-        c = BoardCopy(self.board)
-        c.remove_occupant(file, rank)  # Removes any occupant of the new square
-        c.remove_occupant(self.file, self.rank)  # Removes self from old square
-        c.add_piece(type(self)(file, rank, self.white, c))
-        return c.is_in_check()
+        self.board.make_move(((self.file, self.rank), new_file_rank))
+        out = self.board.is_in_check(color=self.white)
+        self.board.unmake_move()
+        return out
 
     def moveable(self, file_rank: Tuple[int, int]) -> bool:
         """
@@ -190,13 +213,8 @@ class Piece:
         Attempts to move piece. Returns True iff piece is successfully moved.
         If override argument is given and True, move will be executed regardless of validity.
         """
-        m = Move(self.file, self.rank, file, rank, self)
-        if m.can_move or override:
-            self.board.remove_occupant(file, rank)
-            self.file = file
-            self.rank = rank
-            self.board.moved(m)
-            self.board.moves_made += int(self.white)
+        if override or (file, rank) in self.available_moves():
+            self.board.make_move(((self.file, self.rank), (file, rank)))
             return True
         return False
 
@@ -232,19 +250,6 @@ class Piece:
     def in_range(self) -> bool:
         return in_range((self.file, self.rank))
 
-    def center_bonus(self) -> float:
-        if type(self) == King:
-            if (2 <= self.file <= 7) and (2 <= self.rank <= 7):
-                return -0.2
-            else:
-                return 0
-        if self.board.moves_made <= 10:
-            if (4 <= self.file <= 5) and (4 <= self.rank <= 5):
-                return 0.2
-            if (3 <= self.file <= 6) and (3 <= self.rank <= 6):
-                return 0.1
-        return 0
-
     def __str__(self) -> str:
         # TODO Implement
         pass
@@ -254,6 +259,7 @@ class Pawn(Piece):
     """
     A pawn.
     """
+    __slots__ = ()
     file: int
     rank: int
     white: bool
@@ -277,45 +283,34 @@ class Pawn(Piece):
                     in_range((self.file + i, self.rank + (self.white * 2 - 1)))):
                 out.append((self.file + i, self.rank + (self.white * 2 - 1)))
         # En-passant:
-        if (self.board.retrieve(-1).can_en_passant() == self.file + 1) and (self.rank == self.white + 4):
+        if (self.board.en_passant == self.file + 1) and (self.rank == self.white + 4):
             out.append((self.file + 1, self.rank + (int(self.white) * 2 - 1)))
-        elif (self.board.retrieve(-1).can_en_passant() == self.file - 1) and (self.rank == self.white + 4):
+        elif (self.board.en_passant == self.file - 1) and (self.rank == self.white + 4):
             out.append((self.file - 1, self.rank + (int(self.white) * 2 - 1)))
         return out
 
-    def move(self, file: int, rank: int) -> bool:
+    def _legal_moves(self, pins: Dict[Tuple[int, int], List[Tuple[int, int]]],
+                     evasions: Optional[List[Tuple[int, int]]]) -> List[Tuple[int, int]]:
         """
-        Attempts to move pawn. Returns True iff successfully moved.
-
-        Pre-conditions:
-        if (self.white and self.rank == 7) or (not self.white and self.rank == 2), promote_to is not None
-        """
-        # TODO Re-implement promotion stuff:
-        if (self.white and self.rank == 7) or (not self.white and self.rank == 2):
-            # Promotion:
-            if Piece.move(self, file, rank):
-                self.board.add_piece(Queen(self.file, self.rank, self.white, self.board), True)
-                self.board.remove_occupant(self.file, self.rank)
-                self.board.moves_made += int(self.white)
-        # TODO: Look up how to use input() for both run.py and game.py
-        # For now, all promotions are to a Queen.
-                return True
-            return False
-        # en-passant:
-        elif ((file, rank) in self._valid_moves()) and (self.file != file) and (self.board.occupant(file, rank) is None):
-            if Piece.move(self, file, rank):
-                self.board.remove_occupant(file, self.white + 4)
-                return True
-            return False
-        # standard pawn move:
-        else:
-            return Piece.move(self, file, rank)
+        Same as Piece._legal_moves, except en-passant captures are tested by playing them,
+        since they remove a piece from a square other than the one moved to.
+        """
+        out = []
+        ray = pins.get((self.file, self.rank))
+        for move in self._valid_moves():
+            if move[0] != self.file and self.board.occupant(move) is None:
+                if not self._will_be_in_check(move):
+                    out.append(move)
+            elif (evasions is None or move in evasions) and (ray is None or move in ray):
+                out.append(move)
+        return out
 
 
 class Knight(Piece):
     """
     A knight.
     """
+    __slots__ = ()
     file: int
     rank: int
     white: bool
@@ -333,6 +328,7 @@ class Bishop(Piece):
     """
     A bishop.
     """
+    __slots__ = ()
     file: int
     rank: int
     white: bool
@@ -357,6 +353,7 @@ class Rook(Piece):
     """
     A rook.
     """
+    __slots__ = ('has_moved',)
     file: int
     rank: int
     white: bool
@@ -381,18 +378,12 @@ class Rook(Piece):
                 out.append((f + i[0], r + i[1]))
         return out
 
-    def move(self, file: int, rank: int, override: bool = False) -> bool:
-        if Piece.move(self, file, rank, override):
-            self.has_moved = True
-            self.board.moves_made += int(self.white)
-            return True
-        return False
-
 
 class Queen(Piece):
     """
     A queen.
     """
+    __slots__ = ()
     file: int
     rank: int
     white: bool
@@ -417,6 +408,7 @@ class King(Piece):
     """
     A king.
     """
+    __slots__ = ('has_moved',)
     file: int
     rank: int
     white: bool
@@ -437,52 +429,39 @@ class King(Piece):
                 out.append((self.file + i[0], self.rank + i[1]))
         return out
 
-    def available_moves(self) -> List[Tuple[int, int]]:
-        """Adds castling"""
-        return Piece.available_moves(self) + self.can_castle()
+    def _legal_moves(self, pins: Dict[Tuple[int, int], List[Tuple[int, int]]],
+                     evasions: Optional[List[Tuple[int, int]]]) -> List[Tuple[int, int]]:
+        """
+        Adds castling. Pins and evasions don't apply to the king: instead each square is tested
+        for attacks with the king lifted off the board, so it can't block an attack on a square behind it.
+        """
+        sq = square_index(self.file, self.rank)
+        self.board._squares[sq] = None
+        out = [move for move in self._valid_moves() if not self.board.is_in_check(move, self.white)]
+        self.board._squares[sq] = self
+        return out + self.can_castle()
 
     def can_castle(self) -> List[Tuple[int, int]]:
-        if self.has_moved or self.board.is_in_check():
+        if self.has_moved or self.board.is_in_check(color=self.white):
             return []
         out = []
         ks_rook, qs_rook = self.board.occupant(8, self.rank), self.board.occupant(1, self.rank)
+        # The king isn't in check, so it can't be blocking an attack on the squares it passes through.
         if type(ks_rook) == Rook and not ks_rook.has_moved \
-                and not self._will_be_in_check((6, self.rank)) \
-                and not self._will_be_in_check((7, self.rank)) \
                 and self.board.occupant(6, self.rank) is None \
-                and self.board.occupant(7, self.rank) is None:
+                and self.board.occupant(7, self.rank) is None \
+                and not self.board.is_in_check((6, self.rank), self.white) \
+                and not self.board.is_in_check((7, self.rank), self.white):
             out.append((7, self.rank))
         if type(qs_rook) == Rook and not qs_rook.has_moved \
-                and not self._will_be_in_check((4, self.rank)) \
-                and not self._will_be_in_check((3, self.rank)) \
                 and self.board.occupant(4, self.rank) is None \
-                and self.board.occupant(3, self.rank) is None:
+                and self.board.occupant(3, self.rank) is None \
+                and self.board.occupant(2, self.rank) is None \
+                and not self.board.is_in_check((4, self.rank), self.white) \
+                and not self.board.is_in_check((3, self.rank), self.white):
             out.append((3, self.rank))
         return out
 
-    def move(self, file: int, rank: int, override: bool = False) -> bool:
-        """
-        Attempts to move king. Returns True iff piece is successfully moved.
-        Updates self.has_moved
-
-        Pre-conditions:
-        - file in range(1, 9) and rank in range(1, 9)
-        """
-        old_file = self.file
-        if Piece.move(self, file, rank, override):
-            if old_file - file == 2:
-                self.board.remove_occupant(1, self.rank)
-                self.board.add_piece(Rook(4, self.rank, self.white, self.board))
-                self.board.occupant(4, self.rank).has_moved = True
-            elif old_file - file == -2:
-                self.board.remove_occupant(8, self.rank)
-                self.board.add_piece(Rook(6, self.rank, self.white, self.board))
-                self.board.occupant(6, self.rank).has_moved = True
-            self.has_moved = True
-            self.board.moves_made += int(self.white)
-            return True
-        return False
-
     def _is_in_check(self) -> bool:
         """Returns True iff self is in check, using the Board.is_in_check method."""
         return self.board.is_in_check
@@ -494,52 +473,69 @@ class Board:
     Initializes as a set board ready for play.
     turn == True indicates white's turn to play.
     turn == False indicates black's turn to play.
-    _en_passant is the file where the pawn can be captured
+    en_passant is the file where the pawn can be captured
     """
     _pieces: List[Piece]   # A list of all pieces currently on the Board (order doesn't matter).
+    _squares: List[Optional[Piece]]  # The occupant of each square, indexed by square_index(file, rank).
     turn: bool             # Whose turn it is (white or black).
     _move_log: List[Move]  # A list of all moves.
     is_playable: bool      # Does the board have exactly 1 King of each color?
     requesting: bool       # The board is requesting an input from the client for pawn promotion.
     promote_to: Piece      # A container for which piece to promote pawn to. Default is Queen.
     moves_made: int        # Keeps track of how many moves (by white) have been made in the game.
+    halfmove_clock: int    # Moves (by either side) since the last capture or pawn move.
+    en_passant: Optional[int]  # The file of a pawn that just moved 2 squares, or None.
+    _history: List[tuple]  # Undo records for unmake_move.
+    position_history: List[int]  # Zobrist hashes of the earlier positions of the game, oldest first.
+    zobrist: int           # Zobrist hash of the position, updated incrementally.
+    _score: List[List[int]]  # Material plus piece-square score of each colour per phase, in centipawns.
+    _moves_cache: Optional[List[Tuple[Tuple[int, int], Tuple[int, int]]]]  # legal_moves() of the position.
+    _status_cache: Optional[int]  # status() of the position.
 
     def __init__(self, ready_to_play: bool = True):
         self._pieces = []
+        self._squares = [None] * 64
+        self.zobrist = 0
+        self._score = [[0, 0], [0, 0]]
+        self._moves_cache, self._status_cache = None, None
         self._move_log = [EmptyMove()]
         self.is_playable = ready_to_play
         self.requesting = False
         self.promote_to = Queen
         self.moves_made = 0
+        self.halfmove_clock = 0
         if ready_to_play:
             # Initialize kings:
             for r in [1, 8]:
-                self._pieces.append(King(5, r, r == 1, self))
+                self.add_piece(King(5, r, r == 1, self))
             # Initialize rooks:
             for f in [1, 8]:
                 for r in [1, 8]:
-                    self._pieces.append(Rook(f, r, r == 1, self))
+                    self.add_piece(Rook(f, r, r == 1, self))
             # Initialize knights:
             for f in [2, 7]:
                 for r in [1, 8]:
-                    self._pieces.append(Knight(f, r, r == 1, self))
+                    self.add_piece(Knight(f, r, r == 1, self))
             # Initialize bishops:
             for f in [3, 6]:
                 for r in [1, 8]:
-                    self._pieces.append(Bishop(f, r, r == 1, self))
+                    self.add_piece(Bishop(f, r, r == 1, self))
             # Initialize queens:
             for r in [1, 8]:
-                self._pieces.append(Queen(4, r, r == 1, self))
+                self.add_piece(Queen(4, r, r == 1, self))
             # Initialize pawns:
             for f in range(1, 9):
                 for r in [2, 7]:
-                    self._pieces.append(Pawn(f, r, r == 2, self))
+                    self.add_piece(Pawn(f, r, r == 2, self))
         # Initialize booleans and en-passant:
         self.turn = True
         self._checkmate = False
         self._draw = False
-        # self._en_passant = None
-        
+        self.en_passant = None
+        self._history = []
+        self.position_history = []
+        self.zobrist = self.compute_zobrist()
+
     def __str__(self) -> str:
         out = ""
         for rank in range(8, 0, -1):
@@ -563,43 +559,35 @@ class Board:
             out = out[:-1] + '\n'
         if not self.check_if_playable():
             return out + "BOARD NOT PLAYABLE."
-        if self.is_checkmate():
-            return out + f"CHECKMATE! {'BLACK'*self.turn + 'WHITE'*(not self.turn)} WINS!"
-        if self.is_stalemate():
-            return out + "DRAW BY STALEMATE."
-        if self.is_repetition():
-            return out + "DRAW BY 3-FOLD REPETITION."
-        if self.is_insufficient():
-            return out + "DRAW BY INSUFFICIENT MATERIAL."
-        return out + "White to play." * self.turn + "Black to play." * (not self.turn) + " CHECK." * (
-                self.is_in_check())
+        return out + status_text(self)
+
+    def status(self) -> int:
+        """
+        Returns CHECKMATE, STALEMATE, REPETITION, FIFTY_MOVES, INSUFFICIENT or ONGOING for the position.
+        The result is cached until the next make_move / unmake_move.
+        """
+        if self._status_cache is None:
+            self._status_cache = position_status(self)
+        return self._status_cache
 
     def is_checkmate(self) -> bool:
         """Returns True iff checkmate."""
-        if not self.is_in_check():
-            return False
-        for p in self.turn_pieces():
-            if p.available_moves():
-                return False
-        if type(self) is Board:
-            print(f"CHECKMATE {'BLACK' if self.turn else 'WHITE'}")  # todo remove?
-        return True
+        return self.status() == CHECKMATE
 
     def is_stalemate(self) -> bool:
         """Returns True iff stalemate."""
-        if self.is_in_check():
-            return False
-        for p in self.turn_pieces():
-            if p.available_moves():
-                return False
-        if type(self) == Board:
-            print("STALEMATE") # todo remove?
-        return True
+        return self.status() == STALEMATE
+
+    def repetitions(self) -> int:
+        """
+        Returns how many times the current position occurred before in the game. Only positions since the last
+        capture or pawn move are compared, as earlier ones can't repeat.
+        """
+        return self.position_history[-2:-self.halfmove_clock - 1:-2].count(self.zobrist)
 
     def is_repetition(self) -> bool:
         """Returns True iff threefold repetition."""
-        # TODO Implement this.
-        pass
+        return self.repetitions() >= 2
 
     def is_insufficient(self) -> bool:
         """Returns True iff draw by insufficient material."""
@@ -619,9 +607,9 @@ class Board:
             for p in self._pieces:
                 if isinstance(p, Bishop):
                     bishops.append(p)
-                elif (not isinstance(p, King)) or (not isinstance(p, Bishop)):
+                elif not isinstance(p, King):
                     return False
-            if bishops[0].white != bishops[1].white and \
+            if len(bishops) == 2 and bishops[0].white != bishops[1].white and \
                     (bishops[0].file + bishops[0].rank) % 2 == (bishops[1].file + bishops[1].rank) % 2:
                 return True
         return False
@@ -665,10 +653,8 @@ class Board:
 
         if rank is None:
             file, rank = file[0], file[1]
-        if in_range((file, rank)):
-            for piece in self._pieces:
-                if piece.file == file and piece.rank == rank:
-                    return piece
+        if 0 < file < 9 and 0 < rank < 9:
+            return self._squares[(rank - 1) * 8 + file - 1]
         return None
 
     def remove_occupant(self, file: int, rank: int) -> bool:
@@ -676,22 +662,47 @@ class Board:
         Removes occupant of specified square if occupied.
         Returns True iff a piece was removed.
         """
-        for i in range(len(self._pieces)):
-            if self._pieces[i].file == file and self._pieces[i].rank == rank:
-                del self._pieces[i]
-                return True
-        return False
+        piece = self.occupant(file, rank)
+        if piece is None:
+            return False
+        self._squares[square_index(file, rank)] = None
+        self._pieces.remove(piece)
+        self._moves_cache, self._status_cache = None, None
+        self.zobrist ^= ZOBRIST_PIECES[type(piece), piece.white][square_index(file, rank)]
+        self._add_score(piece, square_index(file, rank), -1)
+        return True
 
     def remove(self, piece: Piece) -> bool:
         """
         Removes the piece specified.
         Returns True iff a piece was removed.
         """
-        for p in self._pieces:
-            if p is piece:
-                del p
-                return True
-        return False
+        if self.occupant(piece.file, piece.rank) is not piece:
+            return False
+        return self.remove_occupant(piece.file, piece.rank)
+
+    def relocate(self, piece: Piece, file: int, rank: int) -> None:
+        """
+        Moves piece to (file, rank), keeping the square array in sync.
+
+        Pre-conditions:
+        - (file, rank) is empty
+        """
+        keys = ZOBRIST_PIECES[type(piece), piece.white]
+        if self._squares[square_index(piece.file, piece.rank)] is piece:
+            self._squares[square_index(piece.file, piece.rank)] = None
+            self.zobrist ^= keys[square_index(piece.file, piece.rank)]
+            self._add_score(piece, square_index(piece.file, piece.rank), -1)
+        piece.file, piece.rank = file, rank
+        self._squares[square_index(file, rank)] = piece
+        self.zobrist ^= keys[square_index(file, rank)]
+        self._add_score(piece, square_index(file, rank), 1)
+
+    def _add_score(self, piece: Piece, sq: int, sign: int) -> None:
+        """Adds (sign == 1) or subtracts (sign == -1) the score of piece standing on sq to its side's scores."""
+        scores, tables = self._score[piece.white], SQUARE_SCORES[type(piece), piece.white]
+        scores[OPENING] += sign * tables[OPENING][sq]
+        scores[LATER] += sign * tables[LATER][sq]
 
     def retrieve(self, i: int) -> Move:
         """Returns the i-th index of the move log, or empty move if IndexError."""
@@ -700,6 +711,14 @@ class Board:
         except IndexError:
             return self._move_log[0]
 
+    def moves_played(self) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
+        """Returns the moves played on this board (and the board it was copied from), oldest first."""
+        return [((m.old_file, m.old_rank), (m.new_file, m.new_rank)) for m in self._move_log[1:]]
+
+    def piece_count(self) -> int:
+        """Returns the number of pieces on the board, kings included."""
+        return len(self._pieces)
+
     def pieces(self, color: bool = None) -> List[Piece]:
         if color is None:
             return self._pieces
@@ -736,21 +755,26 @@ class Board:
         else:
             return self.black_pieces()
 
-    def points(self, color: bool = None) -> int:
-        """Calculates & returns total material points of a given player."""
+    def phase(self) -> int:
+        """Returns the game phase (OPENING or LATER) whose piece-square tables apply."""
+        return OPENING if self.moves_made <= OPENING_MOVES else LATER
+
+    def points(self, color: bool = None) -> float:
+        """Returns total material plus piece-square points of a given player."""
         if color is None:
             color = self.turn
-        out = 0
-        for piece in self.pieces(color):
-            out += POINTS[type(piece)] + piece.center_bonus()
-        return out
+        return self._score[color][self.phase()] / 100
 
-    def value(self, color: bool = None) -> int:
-        if self.is_checkmate():
-            return float("inf") * (self.turn * 2 - 1)
-        if color is not None:
-            return self.points(color) - self.points(not color)
-        return self.points() - self.points(not self.turn)
+    def value(self, color: bool = None) -> float:
+        """
+        Returns the material and piece-square balance from the point of view of color (default: the side to
+        move). This is kept up to date as pieces move, so it takes constant time; it does not look for
+        checkmate, which can only be the case when there are no legal moves (see status).
+        """
+        if color is None:
+            color = self.turn
+        phase = self.phase()
+        return (self._score[color][phase] - self._score[not color][phase]) / 100
 
     def move(self, old: Union[Piece, str, Tuple[int, int]], new: Union[str, Tuple[int, int]]) -> bool:
         """Returns True iff move is successful. Same as Board.move except takes human chess coordinates.
@@ -771,16 +795,161 @@ class Board:
         if type(new) is str:
             new = human_in(new)
 
-        old_file, old_rank = old
-        new_file, new_rank = new
-        for piece in self._pieces:
-            if piece.file == old_file and piece.rank == old_rank:
-                if piece.white != self.turn:
-                    return False
-                if piece.move(new_file, new_rank):
-                    self.moves_made += int(self.turn)
-                    return True
-        return False
+        piece = self.occupant(old)
+        if piece is None or piece.white != self.turn:
+            return False
+        return piece.move(new[0], new[1])
+
+    def legal_moves(self) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
+        """
+        Returns all legal moves of the side to move, as (old, new) pairs of coordinates.
+        The list is cached until the next make_move / unmake_move; callers get their own copy.
+        """
+        if self._moves_cache is None:
+            pins, evasions = self.move_constraints()
+            self._moves_cache = [((p.file, p.rank), new) for p in self.turn_pieces()
+                                 for new in p._legal_moves(pins, evasions)]
+        return list(self._moves_cache)
+
+    def moves_to(self, file: int, rank: int) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
+        """Returns the legal moves to (file, rank), as (old, new) pairs of coordinates."""
+        return [m for m in self.legal_moves() if m[1] == (file, rank)]
+
+    def move_squares(self, m: Tuple[Tuple[int, int], Tuple[int, int]]) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        """Returns the (old, new) coordinates of move m. Moves of a Board already are (old, new) pairs."""
+        return m
+
+    def move_types(self, m: Tuple[Tuple[int, int], Tuple[int, int]]) -> Tuple[type, Optional[type]]:
+        """Returns the type of the piece making move m and the type of the piece it captures (None if none)."""
+        old, new = m
+        mover, captured = self._squares[square_index(*old)], self._squares[square_index(*new)]
+        if captured is None and mover.type is Pawn and old[0] != new[0]:
+            return Pawn, Pawn  # En passant.
+        return mover.type, captured.type if captured is not None else None
+
+    def move_constraints(self, color: bool = None) -> Tuple[Dict[Tuple[int, int], List[Tuple[int, int]]],
+                                                            Optional[List[Tuple[int, int]]]]:
+        """
+        Returns (pins, evasions) for the king of color (default: the side to move), where
+        - pins maps the square of each pinned piece to the squares it can move to without exposing the king
+          (the squares between the king and the pinning piece, and the pinning piece's square); and
+        - evasions is None if the king isn't in check, and otherwise the squares a piece other than the king
+          must move to (capturing the checking piece or blocking it), which is empty in double check.
+        """
+        if color is None:
+            color = self.turn
+        king = self.return_king(color)
+        pins, checkers, evasions = {}, 0, []
+        # Rays from the king (bishops, rooks and queens):
+        for i in [(1, 0), (0, 1), (-1, 0), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]:
+            slider = Bishop if i[0] and i[1] else Rook
+            f, r = king.file + i[0], king.rank + i[1]
+            ray, pinned = [], None
+            while 0 < f < 9 and 0 < r < 9:
+                ray.append((f, r))
+                p = self._squares[square_index(f, r)]
+                if p is not None:
+                    if p.white == color:
+                        if pinned is not None:
+                            break
+                        pinned = (f, r)
+                    else:
+                        if type(p) is slider or type(p) is Queen:
+                            if pinned is None:
+                                checkers += 1
+                                evasions += ray
+                            else:
+                                pins[pinned] = ray
+                        break
+                f, r = f + i[0], r + i[1]
+        # Knights:
+        for i in [(1, 2), (1, -2), (-1, 2), (-1, -2), (2, 1), (2, -1), (-2, 1), (-2, -1)]:
+            p = self.occupant(king.file + i[0], king.rank + i[1])
+            if type(p) is Knight and p.white != color:
+                checkers += 1
+                evasions.append((p.file, p.rank))
+        # Pawns:
+        for i in (1, -1):
+            p = self.occupant(king.file + i, king.rank + (color * 2 - 1))
+            if type(p) is Pawn and p.white != color:
+                checkers += 1
+                evasions.append((p.file, p.rank))
+        if checkers == 0:
+            return pins, None
+        if checkers > 1:
+            return pins, []
+        return pins, evasions
+
+    def make_move(self, m: Tuple[Tuple[int, int], Tuple[int, int]]) -> None:
+        """
+        Plays move m == (old, new) in place without checking its validity. Undo with unmake_move.
+        Handles captures, castling, en-passant and promotion (to self.promote_to).
+        """
+        (old_file, old_rank), (new_file, new_rank) = m
+        piece = self._squares[square_index(old_file, old_rank)]
+        captured = self._squares[square_index(new_file, new_rank)]
+        if type(piece) is Pawn and old_file != new_file and captured is None:
+            captured = self._squares[square_index(new_file, old_rank)]  # En-passant
+        rook, rook_from = None, None
+        if type(piece) is King and abs(new_file - old_file) == 2:
+            rook_from = (8 if new_file > old_file else 1, old_rank)
+            rook = self.occupant(rook_from)
+        promoted = None
+        if type(piece) is Pawn and new_rank in (1, 8):
+            promoted = self.promote_to(new_file, new_rank, piece.white, self)
+        castling = self.castling_rights()
+        self._history.append((piece, m, captured, rook, rook_from, promoted, getattr(piece, 'has_moved', None),
+                              getattr(rook, 'has_moved', None), self.en_passant, self.moves_made,
+                              self.halfmove_clock, self.zobrist))
+        self.position_history.append(self.zobrist)
+        if self.en_passant is not None:
+            self.zobrist ^= ZOBRIST_EN_PASSANT[self.en_passant]
+
+        if captured is not None:
+            self.remove_occupant(captured.file, captured.rank)
+        self.relocate(piece, new_file, new_rank)
+        if rook is not None:
+            self.relocate(rook, (old_file + new_file) // 2, old_rank)
+            rook.has_moved = True
+        if promoted is not None:
+            self.remove_occupant(new_file, new_rank)
+            self.add_piece(promoted)
+        if type(piece) in (King, Rook):
+            piece.has_moved = True
+        if type(piece) is Pawn and abs(new_rank - old_rank) == 2:
+            self.en_passant = new_file
+            self.zobrist ^= ZOBRIST_EN_PASSANT[new_file]
+        else:
+            self.en_passant = None
+        self.zobrist ^= ZOBRIST_CASTLING[castling] ^ ZOBRIST_CASTLING[self.castling_rights()] ^ ZOBRIST_BLACK_TO_MOVE
+        self._moves_cache, self._status_cache = None, None
+        self.moves_made += int(piece.white)
+        if type(piece) is Pawn or captured is not None:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        self.moved(ForcedMove(m[0], m[1], piece))
+
+    def unmake_move(self) -> None:
+        """Takes back the last move played with make_move."""
+        piece, m, captured, rook, rook_from, promoted, has_moved, rook_has_moved, self.en_passant, self.moves_made, \
+            self.halfmove_clock, zobrist = self._history.pop()
+        self.position_history.pop()
+        self.turn = not self.turn
+        self._move_log.pop()
+        if promoted is not None:
+            self.remove(promoted)
+            self.add_piece(piece)
+        self.relocate(piece, m[0][0], m[0][1])
+        if has_moved is not None:
+            piece.has_moved = has_moved
+        if rook is not None:
+            self.relocate(rook, rook_from[0], rook_from[1])
+            rook.has_moved = rook_has_moved
+        if captured is not None:
+            self.add_piece(captured)
+        self.zobrist = zobrist
+        self._moves_cache, self._status_cache = None, None
 
     def return_king(self, color: bool = None) -> King:
         """Returns the King of specified color"""
@@ -836,18 +1005,88 @@ class Board:
                 return True
         # King check:
         for i in [(1, 0), (0, 1), (-1, 0), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]:
-            if isinstance(self.occupant(file + i[0], rank + i[1]), King):
+            if isinstance(self.occupant(file + i[0], rank + i[1]), King) and \
+                    self.occupant(file + i[0], rank + i[1]).white != color:
                 return True
         # No checks found:
         return False
 
     def add_piece(self, piece, force: bool = False) -> bool:
-        """Returns True if piece was added successfully; False if square was already occupied."""
-        if not (self.occupant(piece.file, piece.rank) is None or force):
-            return False
-        else:
-            self._pieces.append(piece)
-            return True
+        """
+        Returns True if piece was added successfully; False if square was already occupied.
+        If force is True, any occupant of the square is replaced.
+        """
+        if self.occupant(piece.file, piece.rank) is not None:
+            if not force:
+                return False
+            self.remove_occupant(piece.file, piece.rank)
+        self._pieces.append(piece)
+        self._squares[square_index(piece.file, piece.rank)] = piece
+        self._moves_cache, self._status_cache = None, None
+        self.zobrist ^= ZOBRIST_PIECES[type(piece), piece.white][square_index(piece.file, piece.rank)]
+        self._add_score(piece, square_index(piece.file, piece.rank), 1)
+        return True
+
+    def castling_rights(self) -> int:
+        """
+        Returns the castling rights as a mask of WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE and
+        BLACK_QUEENSIDE, derived from King.has_moved and Rook.has_moved.
+        """
+        out = 0
+        for white, rank, kingside, queenside in ((True, 1, WHITE_KINGSIDE, WHITE_QUEENSIDE),
+                                                 (False, 8, BLACK_KINGSIDE, BLACK_QUEENSIDE)):
+            king = self._squares[square_index(5, rank)]
+            if type(king) is not King or king.white != white or king.has_moved:
+                continue
+            for file, right in ((8, kingside), (1, queenside)):
+                rook = self._squares[square_index(file, rank)]
+                if type(rook) is Rook and rook.white == white and not rook.has_moved:
+                    out |= right
+        return out
+
+    def compute_zobrist(self) -> int:
+        """Computes the Zobrist hash of the position from scratch (see ZOBRIST_PIECES)."""
+        out = 0
+        for piece in self._pieces:
+            out ^= ZOBRIST_PIECES[type(piece), piece.white][square_index(piece.file, piece.rank)]
+        out ^= ZOBRIST_CASTLING[self.castling_rights()]
+        if self.en_passant is not None:
+            out ^= ZOBRIST_EN_PASSANT[self.en_passant]
+        if not self.turn:
+            out ^= ZOBRIST_BLACK_TO_MOVE
+        return out
+
+    def copy(self) -> Board:
+        return BoardCopy(self)
+
+    @classmethod
+    def from_fen(cls, fen: str) -> Board:
+        """
+        Returns a new board set up from a FEN string. Castling rights are stored as the has_moved flags
+        of the kings and rooks; missing halfmove clock and fullmove number fields default to 0 and 1.
+        """
+        placement, turn, castling, en_passant, halfmove_clock, fullmove = parse_fen(fen)
+        b = cls(False)
+        for piece_type, white, file, rank in placement:
+            b.add_piece(piece_type(file, rank, white, b))
+        for p in b._pieces:
+            if isinstance(p, (King, Rook)):
+                p.has_moved = True
+        for right, rook_file, rank in ((WHITE_KINGSIDE, 8, 1), (WHITE_QUEENSIDE, 1, 1),
+                                       (BLACK_KINGSIDE, 8, 8), (BLACK_QUEENSIDE, 1, 8)):
+            king, rook = b.occupant(5, rank), b.occupant(rook_file, rank)
+            if castling & right and type(king) is King and type(rook) is Rook and \
+                    king.white == rook.white == (rank == 1):
+                king.has_moved = rook.has_moved = False
+        b.turn, b.en_passant, b.halfmove_clock = turn, en_passant, halfmove_clock
+        b.moves_made = fullmove - int(turn)
+        b.check_if_playable()
+        b.zobrist = b.compute_zobrist()
+        return b
+
+    def to_fen(self) -> str:
+        """Returns the FEN string of the position."""
+        return fen_of(self)
 
     def __eq__(self, other) -> bool:
         if self.turn != other.turn:
@@ -867,6 +1106,7 @@ class BoardCopy(Board):
     Same as a Board, but is initialized by taking a board and copying its attributes.
     """
     _pieces: List[Piece]
+    _squares: List[Optional[Piece]]
     turn: bool
     is_playable: bool
     _move_log: List[Move]
@@ -874,12 +1114,25 @@ class BoardCopy(Board):
 
     def __init__(self, b: Board):
         self._pieces = []
-        self._move_log = [EmptyMove()]  # TODO: May need to change this.
+        self._squares = [None] * 64
+        self.zobrist = 0
+        self._score = [[0, 0], [0, 0]]
+        self._moves_cache, self._status_cache = None, None
+        self._move_log = list(b._move_log)  # The original's pieces, but the moves of the game so far.
         for piece in b._pieces:
-            self._pieces.append(type(piece)(piece.file, piece.rank, piece.white, self))
+            copy = type(piece)(piece.file, piece.rank, piece.white, self)
+            if isinstance(piece, (King, Rook)):
+                copy.has_moved = piece.has_moved
+            self.add_piece(copy)
         self.is_playable = b.is_playable
         self.turn = b.turn
         self.moves_made = b.moves_made
+        self.halfmove_clock = b.halfmove_clock
+        self.en_passant = b.en_passant
+        self.promote_to = b.promote_to
+        self._history = []
+        self.position_history = list(b.position_history)
+        self.zobrist = b.zobrist
 
 
 PIECES = {
@@ -899,6 +1152,136 @@ POINTS = {
     Pawn:   1,
 }
 
+OPENING, LATER = 0, 1  # Game phases of the piece-square tables.
+OPENING_MOVES = 10     # The opening lasts until white has made this many moves.
+
+
+def _square_bonus(cls: type, phase: int, file: int, rank: int) -> int:
+    """The bonus, in centipawns, of a piece of type cls on (file, rank) in the given phase."""
+    if cls is King:
+        return -20 if (2 <= file <= 7) and (2 <= rank <= 7) else 0
+    if phase == OPENING:
+        if (4 <= file <= 5) and (4 <= rank <= 5):
+            return 20
+        if (3 <= file <= 6) and (3 <= rank <= 6):
+            return 10
+    return 0
+
+
+# PIECE_SQUARE[cls][phase][square_index(file, rank)] is the bonus for a white piece; black's are mirrored.
+PIECE_SQUARE = {cls: [[_square_bonus(cls, phase, sq % 8 + 1, sq // 8 + 1) for sq in range(64)]
+                      for phase in (OPENING, LATER)] for cls in POINTS}
+# SQUARE_SCORES[cls, white][phase][sq] is the material plus piece-square score of a piece on sq, in centipawns.
+SQUARE_SCORES = {(cls, white): [[100 * POINTS[cls] + PIECE_SQUARE[cls][phase][sq if white else sq ^ 56]
+                                 for sq in range(64)] for phase in (OPENING, LATER)]
+                 for cls in POINTS for white in (True, False)}
+
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+ONGOING, CHECKMATE, STALEMATE, REPETITION, INSUFFICIENT, FIFTY_MOVES = range(6)  # See Board.status.
+FIFTY_MOVE_PLIES = 100  # The game is drawn after this many plies without a capture or pawn move.
+CASTLING_SYMBOLS = ((WHITE_KINGSIDE, 'K'), (WHITE_QUEENSIDE, 'Q'), (BLACK_KINGSIDE, 'k'), (BLACK_QUEENSIDE, 'q'))
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+def position_status(b: 'Board') -> int:
+    """
+    Returns CHECKMATE, STALEMATE, REPETITION, FIFTY_MOVES, INSUFFICIENT or ONGOING for the position of b,
+    which may be a Board or a BitBoard. Both backends' status caches this.
+    """
+    if not b.legal_moves():
+        return CHECKMATE if b.is_in_check() else STALEMATE
+    if b.is_repetition():
+        return REPETITION
+    if b.halfmove_clock >= FIFTY_MOVE_PLIES:
+        return FIFTY_MOVES
+    if b.is_insufficient():
+        return INSUFFICIENT
+    return ONGOING
+
+
+def status_text(b: 'Board') -> str:
+    """Returns the line describing the status of b that ends its string form (see Board.__str__)."""
+    status = b.status()
+    if status == CHECKMATE:
+        return f"CHECKMATE! {'BLACK'*b.turn + 'WHITE'*(not b.turn)} WINS!"
+    if status == STALEMATE:
+        return "DRAW BY STALEMATE."
+    if status == REPETITION:
+        return "DRAW BY 3-FOLD REPETITION."
+    if status == FIFTY_MOVES:
+        return "DRAW BY 50-MOVE RULE."
+    if status == INSUFFICIENT:
+        return "DRAW BY INSUFFICIENT MATERIAL."
+    return "White to play." * b.turn + "Black to play." * (not b.turn) + " CHECK." * b.is_in_check()
+
+
+def parse_fen(fen: str) -> Tuple[List[Tuple[type, bool, int, int]], bool, int, Optional[int], int, int]:
+    """
+    Splits a FEN string into (placement, turn, castling, en_passant, halfmove_clock, fullmove), where placement
+    is a list of (piece type, white, file, rank), castling is a mask of the castling rights and en_passant is a file.
+    """
+    fields = fen.split()
+    if len(fields) < 4 or len(fields[0].split('/')) != 8 or fields[1] not in ('w', 'b'):
+        raise Exception(f"Invalid FEN: {fen}")
+    symbols = {symbol: piece_type for piece_type, symbol in PIECES.items()}
+    placement = []
+    for i, row in enumerate(fields[0].split('/')):
+        file = 1
+        for c in row:
+            if c.isdigit():
+                file += int(c)
+            elif c.upper() in symbols and file <= 8:
+                placement.append((symbols[c.upper()], c.isupper(), file, 8 - i))
+                file += 1
+            else:
+                raise Exception(f"Invalid FEN: {fen}")
+    castling = 0
+    for right, symbol in CASTLING_SYMBOLS:
+        if symbol in fields[2]:
+            castling |= right
+    en_passant = None if fields[3] == '-' else human_in(fields[3])[0]
+    halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+    fullmove = int(fields[5]) if len(fields) > 5 else 1
+    return placement, fields[1] == 'w', castling, en_passant, halfmove_clock, fullmove
+
+
+def fen_of(b) -> str:
+    """
+    Returns the FEN string of a board of either backend. The en-passant square is given after every
+    double pawn move, whether or not a capture is possible.
+    """
+    rows = []
+    for rank in range(8, 0, -1):
+        row, empty = '', 0
+        for file in range(1, 9):
+            p = b.occupant(file, rank)
+            if p is None:
+                empty += 1
+                continue
+            if empty:
+                row, empty = row + str(empty), 0
+            row += PIECES[p.type] if p.white else PIECES[p.type].lower()
+        rows.append(row + (str(empty) if empty else ''))
+    rights = b.castling_rights()
+    castling = ''.join(symbol for right, symbol in CASTLING_SYMBOLS if rights & right) or '-'
+    en_passant = '-' if b.en_passant is None else human_out((b.en_passant, 6 if b.turn else 3))
+    fullmove = b.moves_made + int(b.turn)
+    return f"{'/'.join(rows)} {'w' if b.turn else 'b'} {castling} {en_passant} {b.halfmove_clock} {fullmove}"
+
+# Zobrist keys: the hash of a position is the XOR of the keys of its pieces (by square_index),
+# its castling rights, its en-passant file and whether black is to move.
+_zobrist_random = random.Random(2021)
+ZOBRIST_PIECES = {(p, white): [_zobrist_random.getrandbits(64) for _ in range(64)]
+                  for p in PIECES for white in (True, False)}
+_castling_keys = [_zobrist_random.getrandbits(64) for _ in range(4)]
+ZOBRIST_CASTLING = [0] * 16
+for _rights in range(16):
+    for _i in range(4):
+        if _rights >> _i & 1:
+            ZOBRIST_CASTLING[_rights] ^= _castling_keys[_i]
+ZOBRIST_EN_PASSANT = [0] + [_zobrist_random.getrandbits(64) for _ in range(8)]  # Indexed by file.
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+
 if __name__ == '__main__':
     b = Board()
     from preset_moves import castle
@@ -1,20 +1,116 @@
 from main import *
+from bitboard import BACKENDS, backend_of
+from tablebase import Tablebase, open_tablebase
+from concurrent.futures import Executor, ProcessPoolExecutor
+import threading
+import time
 
 
-class GameState:
-    pass
+MATE = 100000  # Score of being checkmated; mates found further from the root score slightly less.
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2  # Bound types of transposition table scores.
+# Move ordering keys: the hash/PV move, then captures by MVV-LVA, then killers, then the history table.
+HASH_MOVE_KEY, CAPTURE_KEY, KILLER_KEY = 3 << 40, 2 << 40, 1 << 40
+DELTA_MARGIN = 2  # Quiescence search skips captures that can't raise the score to alpha even with this bonus.
+
+
+class SearchAborted(Exception):
+    """Raised inside a GameState search when its time or node budget runs out, or it is stopped."""
+
+
+class TranspositionTable:
+    """
+    A fixed-size hash table of search results, indexed by Board.zobrist.
+
+    Each slot holds one entry (zobrist, depth, score, bound, move, generation). A new entry replaces the
+    old one only if it was searched at least as deep, or the old one is from an earlier search
+    (depth-preferred replacement).
+    """
+    _entries:   List[Optional[tuple]]
+    _mask:      int
+    generation: int  # Incremented by new_search, so entries from earlier searches can be replaced.
+    hits:       int
+
+    def __init__(self, size: int = 1 << 16):
+        """Pre-condition: size is a power of 2"""
+        self._entries = [None] * size
+        self._mask = size - 1
+        self.generation = 0
+        self.hits = 0
+
+    def new_search(self) -> None:
+        self.generation += 1
+
+    def get(self, zobrist: int) -> Optional[tuple]:
+        """Returns the (zobrist, depth, score, bound, move, generation) entry for zobrist, or None."""
+        entry = self._entries[zobrist & self._mask]
+        if entry is not None and entry[0] == zobrist:
+            self.hits += 1
+            return entry
+        return None
+
+    def put(self, zobrist: int, depth: int, score: float, bound: int, move: object) -> None:
+        i = zobrist & self._mask
+        old = self._entries[i]
+        if old is None or old[5] != self.generation or depth >= old[1]:
+            self._entries[i] = (zobrist, depth, score, bound, move, self.generation)
+
+
+def _to_table(score: float, ply: int) -> float:
+    """Mate scores are stored relative to the node rather than the root."""
+    if score >= MATE - 1000:
+        return score + ply
+    if score <= 1000 - MATE:
+        return score - ply
+    return score
+
+
+def _from_table(score: float, ply: int) -> float:
+    if score >= MATE - 1000:
+        return score - ply
+    if score <= 1000 - MATE:
+        return score + ply
+    return score
 
 
 class GameState:
+    """
+    An alpha-beta (negamax) search of a board's game tree, from the point of view of the side to move.
+
+    Depths 1, 2, ..., depth are searched in turn (iterative deepening), each iteration trying the
+    principal variation of the previous one first. If the time or node budget runs out, the result
+    of the last completed iteration is kept. Moves are made and unmade on the board itself, and only the
+    current line and the best line below it are held in memory, so apart from the (fixed-size) transposition
+    table the search uses memory in proportion to its depth, not to the number of nodes.
+
+    Leaves are scored by a quiescence search, which plays out captures (and every move when in check)
+    until the position is quiet, so pending trades are not cut off at the horizon.
+
+    Moves are searched in order: the hash or PV move, captures by most valuable victim / least valuable
+    attacker, the (up to 2) killer moves of the ply, then other moves by their history score.
+
+    Below the root, positions with few enough pieces to be in the endgame tables are scored from them.
+    """
+    __slots__ = ('_board', '_depth', '_time_limit', '_node_limit', '_deadline', '_stop', 'table', '_value', 'pv',
+                 'nodes', 'qnodes', 'completed_depth', '_killers', '_history', 'cutoffs', 'first_move_cutoffs',
+                 '_tablebase', 'tbhits')
     _board:         Board
-    _real_board:    Board
-    _children:      List[GameState]
-    _value:         int
-    _p:             Optional[Piece]
-    _m:             Optional[Tuple[int, int]]
-    _alpha:         int
-    _beta:          int
-    root_turn:      bool
+    _depth:         int
+    _time_limit:    Optional[float]
+    _node_limit:    Optional[int]
+    _deadline:      Optional[float]
+    _stop:          Optional[threading.Event]
+    table:          TranspositionTable
+    _value:         float
+    pv:             List[object]  # The best line found, in the board's own move format.
+    nodes:          int           # Nodes searched, over all iterations, not counting qnodes.
+    qnodes:         int           # Nodes searched by the quiescence search.
+    completed_depth: int          # The deepest iteration that finished within the budget.
+    _killers:       List[List[object]]        # Quiet moves that last caused a beta cutoff, per ply.
+    _history:       Dict[Tuple[bool, object], int]  # Cutoff counts of quiet moves, weighted by depth.
+    cutoffs:        int           # Nodes where a move caused a beta cutoff.
+    first_move_cutoffs: int       # Of those, the nodes where it was the first move searched.
+    _tablebase:     Tablebase
+    tbhits:         int           # Nodes scored from the endgame tables.
 
     def __eq__(self, other) -> bool:
         return self._value == other._value
@@ -22,34 +118,310 @@ class GameState:
     def __lt__(self, other) -> bool:
         return self._value < other._value
 
-    def __init__(self, b: Board, depth: int = 2, root_turn: bool = None, _p=None, _m=None):
-        """Pre-condition: depth >= 2 and depth % 2 == 0"""
+    def __init__(self, b: Board, depth: int = 2, time_limit: float = None, node_limit: int = None,
+                 table: TranspositionTable = None, stop: threading.Event = None, tablebase: Tablebase = None):
+        """
+        Searches b to the given depth, within an optional time limit (in seconds) and node limit.
+        The search plays moves on b with make_move / unmake_move, so b is left in its original position.
+        A table can be passed in to reuse results between searches (e.g. between moves of a game).
+        Setting stop (from another thread) ends the search early, like running out of time.
+        The endgame tables are those of tablebase.TB_DIR unless tablebase is given.
+        """
+        self._board = b
+        self.table = table if table is not None else TranspositionTable()
+        self._depth = depth
+        self._time_limit = time_limit
+        self._node_limit = node_limit
+        self._deadline = None
+        self._stop = stop
+        self.pv = []
+        self.nodes = 0
+        self.qnodes = 0
+        self.completed_depth = 0
+        self._value = 0
+        self._killers = []
+        self._history = {}
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self._tablebase = tablebase if tablebase is not None else open_tablebase()
+        self.tbhits = 0
+        self._search()
+
+    def _search(self) -> None:
+        if self._time_limit is not None:
+            self._deadline = time.time() + self._time_limit
+        self.table.new_search()
+        for depth in range(1, self._depth + 1):
+            try:
+                value, pv = self._negamax(depth, float("-inf"), float("inf"), 0, self.pv)
+            except SearchAborted:
+                break
+            self._value, self.pv, self.completed_depth = value, pv, depth
+            if abs(value) >= MATE - depth:
+                break  # A forced mate was found; searching deeper won't change the move.
+        if not self.pv:
+            # Not even depth 1 finished within the budget.
+            self.pv = self._board.legal_moves()[:1]
+
+    def _negamax(self, depth: int, alpha: float, beta: float, ply: int,
+                 pv_hint: List[object]) -> Tuple[float, List[object]]:
+        """
+        Returns the value of the board for the side to move, searched to depth with an (alpha, beta) window,
+        along with the best line from this position. pv_hint is a line to try first.
+        """
+        self.nodes += 1
+        self._check_budget()
+
+        b = self._board
+        # A repeated position is scored as a draw, since the side that can avoid repeating it would have.
+        # Checked before the table, whose entries don't know how a position was reached.
+        if ply > 0 and (b.repetitions() or (b.halfmove_clock >= FIFTY_MOVE_PLIES and b.status() != CHECKMATE)):
+            return 0, []
+        # The tables give the exact distance to mate, so no search is needed.
+        if ply > 0 and b.piece_count() <= self._tablebase.max_pieces:
+            found = self._tablebase.probe(b)
+            if found is not None:
+                self.tbhits += 1
+                return found[0] * (MATE - ply - found[1]), []
+        entry = self.table.get(b.zobrist)
+        if entry is not None and entry[1] >= depth and ply > 0:
+            score, bound, move = _from_table(entry[2], ply), entry[3], entry[4]
+            if bound == EXACT or (bound == LOWER_BOUND and score >= beta) or (bound == UPPER_BOUND and score <= alpha):
+                return score, [move] if move is not None else []
+
+        if depth == 0:
+            return self._quiesce(alpha, beta, ply), []
+
+        moves = b.legal_moves()
+        if not moves:
+            return (ply - MATE if b.is_in_check() else 0), []
+        first = pv_hint[0] if pv_hint else entry[4] if entry is not None else None
+        moves = self._order_moves(moves, ply, first)
 
-        self._board = BoardCopy(b)
-        self._real_board = b
-        self._children = []
-        self._p, self._m = _p, _m
-        if root_turn is None:
-            self.root_turn = b.turn
+        alpha_orig = alpha
+
+        best, best_line = float("-inf"), []
+        for i, m in enumerate(moves):
+            b.make_move(m)
+            try:
+                hint = pv_hint[1:] if pv_hint and m == pv_hint[0] else []
+                score, line = self._negamax(depth - 1, -beta, -alpha, ply + 1, hint)
+            finally:
+                b.unmake_move()
+            score = -score
+            if score > best:
+                best, best_line = score, [m] + line
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                self._record_cutoff(m, i, depth, ply)
+                break
+        if best <= alpha_orig:
+            bound = UPPER_BOUND
+        elif best >= beta:
+            bound = LOWER_BOUND
         else:
-            self.root_turn = root_turn
-
-        if depth >= 1:
-            for p in self._board.turn_pieces():
-                for m in p.available_moves():
-                    copy = BoardCopy(b)
-                    copy.move(p, m)
-                    self._children.append(GameState(copy, depth - 1, self.root_turn, p, m))
-
-        # Calculating value:
-        if not self._children:
-            self._value = self._board.value()
-        elif self._real_board.turn == root_turn:
-            self._value = max(self._children)._value
+            bound = EXACT
+        self.table.put(b.zobrist, depth, _to_table(best, ply), bound, best_line[0])
+        return best, best_line
+
+    def _check_budget(self) -> None:
+        """Raises SearchAborted if the node or time budget has run out, or the search was stopped."""
+        n = self.nodes + self.qnodes
+        if self._node_limit is not None and n > self._node_limit:
+            raise SearchAborted
+        if n % 1024 == 0 and ((self._deadline is not None and time.time() > self._deadline) or
+                              (self._stop is not None and self._stop.is_set())):
+            raise SearchAborted
+
+    def _quiesce(self, alpha: float, beta: float, ply: int) -> float:
+        """
+        Returns the value of the board for the side to move, searching only captures (or all evasions when
+        in check) with an (alpha, beta) window. The side to move may stand pat on its current value instead
+        of capturing. Scores outside the window are only bounds, so they are not stored in the table.
+        """
+        self.qnodes += 1
+        self._check_budget()
+
+        b = self._board
+        moves = b.legal_moves()
+        if b.is_in_check():
+            if not moves:
+                return ply - MATE
+            best = float("-inf")
+            ordered = self._order_moves(moves, ply, None)
         else:
-            self._value = min(self._children)._value
+            if not moves:
+                return 0
+            best = stand_pat = b.value()
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+            keys = {}
+            for m in moves:
+                mover, captured = b.move_types(m)
+                # Delta pruning: skip captures that can't bring the score up to alpha.
+                if captured is not None and stand_pat + POINTS[captured] + DELTA_MARGIN > alpha:
+                    keys[m] = 16 * POINTS[captured] - POINTS[mover]
+            ordered = sorted(keys, key=keys.__getitem__, reverse=True)
+
+        for m in ordered:
+            b.make_move(m)
+            try:
+                score = -self._quiesce(-beta, -alpha, ply + 1)
+            finally:
+                b.unmake_move()
+            if score > best:
+                best = score
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+        return best
+
+    def _order_moves(self, moves: List[object], ply: int, first: Optional[object]) -> List[object]:
+        """Returns moves sorted into search order, with first (the hash or PV move) at the front."""
+        b = self._board
+        while len(self._killers) <= ply:
+            self._killers.append([])
+        killers = self._killers[ply]
+        keys = {}
+        for m in moves:
+            if m == first:
+                keys[m] = HASH_MOVE_KEY
+                continue
+            mover, captured = b.move_types(m)
+            if captured is not None:
+                keys[m] = CAPTURE_KEY + 16 * POINTS[captured] - POINTS[mover]
+            elif m in killers:
+                keys[m] = KILLER_KEY - killers.index(m)
+            else:
+                keys[m] = self._history.get((b.turn, m), 0)
+        moves.sort(key=keys.__getitem__, reverse=True)
+        return moves
+
+    def _record_cutoff(self, m: object, i: int, depth: int, ply: int) -> None:
+        """Updates the statistics, killers and history after move m, searched i-th, caused a beta cutoff."""
+        self.cutoffs += 1
+        if i == 0:
+            self.first_move_cutoffs += 1
+        b = self._board
+        if b.move_types(m)[1] is not None:
+            return  # Captures are already ordered first.
+        killers = self._killers[ply]
+        if m not in killers:
+            killers.insert(0, m)
+            del killers[2:]
+        key = (b.turn, m)
+        self._history[key] = self._history.get(key, 0) + depth * depth
+
+    def first_move_cutoff_rate(self) -> float:
+        """Returns the fraction of beta cutoffs caused by the first move searched (1.0 is perfect ordering)."""
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def best_move(self) -> Optional[object]:
+        """Returns the best move found, in the board's own move format, or None if there are no moves."""
+        return self.pv[0] if self.pv else None
 
     def make_best_move(self) -> None:
 
-        if self._children:
-            self._real_board.move(max(self._children)._p, max(self._children)._m)
+        if self.pv:
+            self._board.make_move(self.pv[0])
+
+
+_worker_table = None  # The transposition table _search_root_move reuses between the tasks of a process.
+
+
+def _search_root_move(task: Tuple[str, str, List[int], object, int, float],
+                      stop: threading.Event = None) -> Tuple[float, List[object], int, int]:
+    """
+    Searches one root move for ParallelSearch, possibly in a worker process.
+    task is (backend, fen, position_history, move, depth, alpha): move is played on the position given by its
+    FEN string and earlier position hashes (for repetitions), and searched to depth (counting the move) with
+    a window of (alpha, inf) from the root's point of view. Returns (score, line after move, nodes, qnodes).
+    Each process keeps one transposition table for all its tasks, so results carry over between root moves
+    and searches. Setting stop (only when run in-process) raises SearchAborted.
+    """
+    global _worker_table
+    if _worker_table is None:
+        _worker_table = TranspositionTable()
+    backend, fen, position_history, move, depth, alpha = task
+    b = BACKENDS[backend].from_fen(fen)
+    b.position_history = position_history
+    b.make_move(move)
+    state = GameState(b, 0, table=_worker_table, stop=stop)
+    value, line = 0, []
+    for d in range(depth):  # Iterative deepening of the reply, starting from its quiescence search.
+        value, line = state._negamax(d, float("-inf"), -alpha, 1, line)
+    return -value, line, state.nodes, state.qnodes
+
+
+class ParallelSearch:
+    """
+    A depth-limited alpha-beta search whose root moves are split across worker processes, with the same
+    results interface as GameState (pv, nodes, qnodes, completed_depth, best_move, make_best_move).
+
+    The best move of a search one ply shallower is searched first, here, to get a lower bound on the value
+    of the position. The other root moves are then searched in parallel against that bound, so only moves
+    that beat it get exact scores. Workers are sent each position as a FEN string, the hashes of the positions
+    since the last capture or pawn move, and the move to play.
+    """
+    _board:         Board
+    _value:         float
+    pv:             List[object]
+    nodes:          int
+    qnodes:         int
+    completed_depth: int
+
+    def __init__(self, b: Board, depth: int = 2, workers: int = 2, executor: Executor = None,
+                 stop: threading.Event = None):
+        """
+        Searches b to the given depth using workers processes, or the processes of executor if one is given
+        (so a pool can be reused between searches). Setting stop ends the search early. Once the best move
+        of the shallower search has been searched to full depth, the best root move found so far is kept;
+        before that, the result is that of the shallower search.
+        """
+        self._board = b
+        state = GameState(b, depth - 1 if depth > 1 and workers > 1 else depth, stop=stop)
+        self._value, self.pv, self.nodes, self.qnodes = state._value, state.pv, state.nodes, state.qnodes
+        self.completed_depth = state.completed_depth
+        moves = b.legal_moves()
+        if depth <= 1 or workers <= 1 or len(moves) <= 1 or state.completed_depth < depth - 1:
+            return
+        first = state.best_move()
+        fen, backend = b.to_fen(), backend_of(b)
+        history = b.position_history[len(b.position_history) - b.halfmove_clock:]
+        try:
+            best, line, nodes, qnodes = _search_root_move((backend, fen, history, first, depth, float("-inf")), stop)
+        except SearchAborted:
+            return
+        best_line = [first] + line
+        self.nodes, self.qnodes = self.nodes + nodes, self.qnodes + qnodes
+
+        pool = executor if executor is not None else ProcessPoolExecutor(workers)
+        rest = [m for m in moves if m != first]
+        futures = [pool.submit(_search_root_move, (backend, fen, history, m, depth, best)) for m in rest]
+        try:
+            for m, future in zip(rest, futures):
+                if stop is not None and stop.is_set():
+                    break
+                score, line, nodes, qnodes = future.result()
+                self.nodes, self.qnodes = self.nodes + nodes, self.qnodes + qnodes
+                if score > best:
+                    best, best_line = score, [m] + line
+            else:
+                self.completed_depth = depth
+            self._value, self.pv = best, best_line
+        finally:
+            for future in futures:
+                future.cancel()
+            if executor is None:
+                pool.shutdown()
+
+    def best_move(self) -> Optional[object]:
+        """Returns the best move found, in the board's own move format, or None if there are no moves."""
+        return self.pv[0] if self.pv else None
+
+    def make_best_move(self) -> None:
+        if self.pv:
+            self._board.make_move(self.pv[0])
@@ -0,0 +1,106 @@
+from bitboard import *
+import argparse
+import sys
+import time
+
+
+# Standard perft positions, with their known node counts per depth.
+# Pawns only promote to queens here, so counts are only listed for depths without promotions.
+POSITIONS = [
+    ("start", START_FEN,
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862]),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6]),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+def perft(b: Union[Board, BitBoard], depth: int) -> int:
+    """Counts the leaf nodes of the legal move tree of b to the given depth."""
+    if depth == 0:
+        return 1
+    moves = b.legal_moves()
+    if depth == 1:
+        return len(moves)
+    out = 0
+    for m in moves:
+        b.make_move(m)
+        out += perft(b, depth - 1)
+        b.unmake_move()
+    return out
+
+
+def divide(b: Union[Board, BitBoard], depth: int) -> Dict[str, int]:
+    """Returns the perft count below each root move, keyed by the move in coordinate notation (e.g. e2e4)."""
+    out = {}
+    for m in b.legal_moves():
+        old, new = b.move_squares(m)
+        b.make_move(m)
+        out[human_out(old) + human_out(new)] = perft(b, depth - 1)
+        b.unmake_move()
+    return out
+
+
+def run_suite(backend: str = 'object', max_depth: int = 3) -> bool:
+    """
+    Runs perft on every position of POSITIONS up to max_depth, printing node counts, timings and
+    nodes/second. Returns True iff every count matches the known one.
+    """
+    ok = True
+    total_nodes, total_time = 0, 0.0
+    for name, fen, expected in POSITIONS:
+        b = BACKENDS[backend].from_fen(fen)
+        for depth, count in enumerate(expected[:max_depth], 1):
+            start = time.perf_counter()
+            nodes = perft(b, depth)
+            elapsed = time.perf_counter() - start
+            total_nodes, total_time = total_nodes + nodes, total_time + elapsed
+            ok = ok and nodes == count
+            print(f"{name:<12} depth {depth}: {nodes:>9} nodes  {elapsed:8.3f}s  "
+                  f"{nodes / max(elapsed, 1e-9):>10.0f} nodes/s  {'ok' if nodes == count else f'EXPECTED {count}'}")
+    print(f"{backend}: {total_nodes} nodes in {total_time:.3f}s ({total_nodes / max(total_time, 1e-9):.0f} nodes/s)")
+    return ok
+
+
+def compare_backends(depth: int = 2) -> bool:
+    """
+    Checks that all backends agree on perft counts for every position of POSITIONS.
+    Prints each result and returns True iff all counts match.
+    """
+    ok = True
+    for name, fen, _ in POSITIONS:
+        counts = [perft(BACKENDS[backend].from_fen(fen), depth) for backend in BACKENDS]
+        print(f"{name}: {' '.join(f'{k}={n}' for k, n in zip(BACKENDS, counts))}")
+        ok = ok and len(set(counts)) == 1
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Perft move generator correctness checks and benchmark.")
+    parser.add_argument('--backend', choices=list(BACKENDS), default='object')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--fen', help="run perft on this position instead of the test suite")
+    parser.add_argument('--divide', action='store_true', help="print the node count below each root move")
+    parser.add_argument('--compare', action='store_true', help="check that all backends give the same counts")
+    args = parser.parse_args()
+
+    if args.compare:
+        passed = compare_backends(args.depth)
+    elif args.fen is not None:
+        board = BACKENDS[args.backend].from_fen(args.fen)
+        if args.divide:
+            for move, n in sorted(divide(board, args.depth).items()):
+                print(f"{move}: {n}")
+        t = time.perf_counter()
+        n = perft(board, args.depth)
+        t = time.perf_counter() - t
+        print(f"depth {args.depth}: {n} nodes in {t:.3f}s ({n / max(t, 1e-9):.0f} nodes/s)")
+        passed = True
+    else:
+        passed = run_suite(args.backend, args.depth)
+    print("OK" if passed else "FAILED")
+    sys.exit(0 if passed else 1)
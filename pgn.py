@@ -0,0 +1,278 @@
+from bitboard import *
+import argparse
+import re
+import time
+from typing import *
+
+
+SEVEN_TAG_ROSTER = ['Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result']  # Required PGN tags, in order.
+RESULTS = ['1-0', '0-1', '1/2-1/2', '*']
+CASTLES = {'O-O': 2, 'O-O-O': -2, '0-0': 2, '0-0-0': -2}  # File change of the king of each castling SAN.
+_PIECE_OF_SYMBOL = {symbol: cls for cls, symbol in PIECES.items() if cls is not Pawn}
+_TAG = re.compile(r'\[\s*(\w+)\s*"((?:[^"\\]|\\.)*)"\s*\]')
+# Movetext tokens: comments, recursive variations, NAGs, and anything else (moves, move numbers, results).
+_TOKEN = re.compile(r'\{[^}]*\}?|;.*|\(|\)|\$\d+|[^\s{}();$]+')
+_MOVE_NUMBER = re.compile(r'^\d+\.+')
+
+
+def san(b: Union[Board, BitBoard], m: object) -> str:
+    """Returns the standard algebraic notation (e.g. Nbd7, exd6, O-O, e8=Q+) of the legal move m on b."""
+    old, new = b.move_squares(m)
+    mover, captured = b.move_types(m)
+    if mover is King and abs(new[0] - old[0]) == 2:
+        out = "O-O" if new[0] > old[0] else "O-O-O"
+    elif mover is Pawn:
+        out = (human_out(old)[0] + 'x' if captured is not None else '') + human_out(new)
+        if new[1] in (1, 8):
+            out += '=' + PIECES[Queen]  # Pawns always promote to queens.
+    else:
+        # Disambiguate from other pieces of the same type that can move to the same square:
+        others = [o for o, n in map(b.move_squares, b.legal_moves())
+                  if n == new and o != old and b.occupant(o).type is mover]
+        square = ''
+        if others:
+            if all(o[0] != old[0] for o in others):
+                square = human_out(old)[0]
+            elif all(o[1] != old[1] for o in others):
+                square = human_out(old)[1]
+            else:
+                square = human_out(old)
+        out = PIECES[mover] + square + ('x' if captured is not None else '') + human_out(new)
+    b.make_move(m)
+    if b.is_in_check():
+        out += '#' if not b.legal_moves() else '+'
+    b.unmake_move()
+    return out
+
+
+def parse_san(b: Union[Board, BitBoard], text: str) -> object:
+    """
+    Returns the legal move of b written as text in standard algebraic notation, in the board's own move format.
+    Check marks and annotations (+, #, !, ?) are ignored, as are missing promotions, since pawns always
+    promote to queens. Raises an Exception if text is not a legal move on b, or is ambiguous.
+    """
+    s = text.rstrip('+#!?')
+    if s in CASTLES:
+        for m in b.legal_moves():
+            old, new = b.move_squares(m)
+            if new[0] - old[0] == CASTLES[s] and b.move_types(m)[0] is King:
+                return m
+        raise Exception(f"Illegal move: {text}")
+    if '=' in s:
+        s, promotion = s.split('=', 1)
+    elif len(s) > 2 and s[-1] in 'QRBN' and s[-2] in '18':  # e8Q
+        s, promotion = s[:-1], s[-1]
+    else:
+        promotion = PIECES[Queen]
+    mover = _PIECE_OF_SYMBOL.get(s[:1], Pawn)
+    if mover is not Pawn:
+        s = s[1:]
+    if promotion != PIECES[Queen] or not re.fullmatch(r'[a-h]?[1-8]?x?[a-h][1-8]', s):
+        raise Exception(f"Invalid or unsupported move: {text}")
+    new = human_in(s[-2:])
+    disambiguation = s[:-2].replace('x', '')
+    found = None
+    for m in b.moves_to(*new):
+        old = b.move_squares(m)[0]
+        if b.move_types(m)[0] is not mover:
+            continue
+        if any(old[0] != ord(c) - ord('a') + 1 if c.isalpha() else old[1] != int(c) for c in disambiguation):
+            continue
+        if found is not None:
+            raise Exception(f"Ambiguous move: {text}")
+        found = m
+    if found is None:
+        raise Exception(f"Illegal move: {text}")
+    return found
+
+
+def result_of(b: Union[Board, BitBoard]) -> str:
+    """Returns the PGN result of the game on b: 1-0, 0-1, 1/2-1/2, or * if it is not over."""
+    status = b.status()
+    if status == CHECKMATE:
+        return '0-1' if b.turn else '1-0'
+    return '*' if status == ONGOING else '1/2-1/2'
+
+
+def _escape(value: str) -> str:
+    """Escapes backslashes and quotes in a tag value."""
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def game_pgn(tags: Dict[str, str], moves: List[str], result: str = '*') -> str:
+    """
+    Returns the PGN text of a game, given its tags (the seven tag roster comes first, with '?' for missing
+    ones), its moves in SAN and its result. The game starts from the position of the FEN tag if there is one,
+    otherwise from the starting position.
+    """
+    tags = dict(tags, Result=result)
+    lines = [f'[{key} "{_escape(tags.get(key, "?"))}"]' for key in SEVEN_TAG_ROSTER]
+    lines += [f'[{key} "{_escape(value)}"]' for key, value in tags.items() if key not in SEVEN_TAG_ROSTER]
+    lines.append('')
+    white_first, number = True, 1
+    if 'FEN' in tags:
+        _, white_first, _, _, _, number = parse_fen(tags['FEN'])
+    tokens = []
+    for i, move in enumerate(moves):
+        ply = i + (not white_first)
+        if ply % 2 == 0:
+            tokens.append(f"{number + ply // 2}. {move}")
+        else:
+            tokens.append(f"{number + ply // 2}... {move}" if i == 0 else move)
+    tokens.append(result)
+    line = ''
+    for token in tokens:  # Movetext lines are kept under 80 characters.
+        if line and len(line) + 1 + len(token) > 79:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return '\n'.join(lines) + '\n\n'
+
+
+class PGNGame:
+    """
+    A game read from or to be written to PGN: its tags, its moves in SAN and its result.
+    The game starts from the position of the FEN tag if there is one, otherwise from the starting position.
+    """
+    tags:   Dict[str, str]
+    moves:  List[str]
+    result: str
+
+    def __init__(self, tags: Dict[str, str] = None, moves: List[str] = None, result: str = '*'):
+        self.tags = tags if tags is not None else {}
+        self.moves = moves if moves is not None else []
+        self.result = result
+
+    def __str__(self) -> str:
+        return game_pgn(self.tags, self.moves, self.result)
+
+    def start(self, backend: str = 'bitboard') -> Union[Board, BitBoard]:
+        """Returns a new board of backend (a key of BACKENDS) set up at the start of the game."""
+        return BACKENDS[backend].from_fen(self.tags['FEN']) if 'FEN' in self.tags else new_board(backend)
+
+    def replay(self, backend: str = 'bitboard') -> Iterator[Tuple[Union[Board, BitBoard], object]]:
+        """
+        Plays through the game on a board of backend, yielding the board before each move together with the
+        move, in the board's own move format. The move is made after the board is yielded back, so the board
+        must be left as it was. Raises an Exception at the first move that is not legal.
+        """
+        b = self.start(backend)
+        for text in self.moves:
+            m = parse_san(b, text)
+            yield b, m
+            b.make_move(m)
+
+    def board(self, backend: str = 'bitboard') -> Union[Board, BitBoard]:
+        """Returns a board of backend with all the moves of the game played."""
+        b = self.start(backend)
+        for text in self.moves:
+            b.make_move(parse_san(b, text))
+        return b
+
+
+def start_of(b: Union[Board, BitBoard]) -> str:
+    """
+    Returns the FEN string of the position the moves of b (see moves_played) were played from, by taking them
+    back and playing them again. b must be able to take back all of them, which a BoardCopy can't.
+    """
+    moves = b.moves_played()
+    for _ in moves:
+        b.unmake_move()
+    start = b.to_fen()
+    for m in moves:
+        b.make_move(m)
+    return start
+
+
+def game_of(b: Union[Board, BitBoard], tags: Dict[str, str] = None, start: str = START_FEN) -> PGNGame:
+    """
+    Returns the game played on b, from the position of the FEN string start, with its result if it is over.
+    The FEN tag is set if the game did not start from the starting position.
+    """
+    tags = dict(tags or {})
+    if start != START_FEN:
+        tags.update(SetUp='1', FEN=start)
+    game = PGNGame(tags, [], result_of(b))
+    replay = BACKENDS[backend_of(b)].from_fen(start)
+    for m in b.moves_played():
+        game.moves.append(san(replay, m))
+        replay.make_move(m)
+    return game
+
+
+def read_games(lines: Iterable[str]) -> Iterator[PGNGame]:
+    """
+    Parses games from PGN text given line by line (e.g. an open file), yielding each game as soon as it has
+    been read, so that archives of any size can be streamed. Comments, recursive variations, NAGs and move
+    number indications are skipped, and annotations are stripped from the moves. The moves are not checked
+    here; see PGNGame.replay.
+    """
+    game, in_comment, variation_depth = PGNGame(), False, 0
+    for line in lines:
+        if in_comment:
+            end = line.find('}')
+            if end < 0:
+                continue
+            line, in_comment = line[end + 1:], False
+        if line.startswith('%'):  # Escaped line.
+            continue
+        stripped = line.strip()
+        if stripped.startswith('[') and variation_depth == 0:
+            if game.moves:  # A game without a result token ended here.
+                game.result = game.tags.get('Result', '*')
+                yield game
+                game = PGNGame()
+            tag = _TAG.match(stripped)
+            if tag is not None:
+                game.tags[tag.group(1)] = re.sub(r'\\(.)', r'\1', tag.group(2))
+            continue
+        for token in _TOKEN.findall(line):
+            if token[0] == '{':
+                in_comment = token[-1] != '}' or len(token) == 1
+            elif token[0] in ';$':
+                continue
+            elif token == '(':
+                variation_depth += 1
+            elif token == ')':
+                variation_depth = max(variation_depth - 1, 0)
+            elif variation_depth > 0:
+                continue
+            elif token in RESULTS:
+                game.result = token
+                yield game
+                game = PGNGame()
+            else:
+                move = _MOVE_NUMBER.sub('', token, count=1).rstrip('!?')  # Also splits "1.e4".
+                if move:
+                    game.moves.append(move)
+    if game.moves or game.tags:
+        game.result = game.tags.get('Result', '*')
+        yield game
+
+
+def write_games(games: Iterable[PGNGame], file: TextIO) -> None:
+    """Writes games to an open file as PGN."""
+    for game in games:
+        file.write(str(game))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Reads and replays every game of a PGN file.")
+    parser.add_argument('file')
+    parser.add_argument('--backend', choices=list(BACKENDS), default='bitboard')
+    args = parser.parse_args()
+    games, plies, errors, start = 0, 0, 0, time.perf_counter()
+    with open(args.file) as f:
+        for game in read_games(f):
+            games += 1
+            try:
+                for _ in game.replay(args.backend):
+                    plies += 1
+            except Exception as e:
+                errors += 1
+                print(f"game {games}: {e}")
+    elapsed = time.perf_counter() - start
+    print(f"{games} games, {plies} plies in {elapsed:.2f}s: {plies / max(elapsed, 1e-9):.0f} plies/s, "
+          f"{errors} games with errors")
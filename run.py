@@ -1,4 +1,5 @@
 from preset_moves import *
+from bitboard import new_board
 
 
 def is_valid_notation(s: str) -> bool:
@@ -16,7 +17,9 @@ MOVES_AVAILABLE = "Moves available:"
 ENTER_SQUARE_1 = "Enter square of piece to move: "
 ENTER_SQUARE_2 = "Enter square to move piece to: "
 
-b = Board()
+BACKEND = 'object'  # Board backend to play on; one of the keys of bitboard.BACKENDS.
+
+b = new_board(BACKEND)
 """INSERT PRESET MOVE FUNCTIONS HERE:"""
 # en_passant_preset(b)
 # check_check_preset(b)
@@ -24,7 +27,7 @@ b = Board()
 
 while True:
     print(b)
-    if b.is_checkmate() or b.is_stalemate() or b.is_insufficient():
+    if b.status() != ONGOING:
         break
     old = input(ENTER_SQUARE_1)
     if old == 'quit' or old == 'exit':
@@ -0,0 +1,199 @@
+from bot import _alg001
+from minimax import GameState
+from pgn import *
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import datetime
+import itertools
+import json
+import math
+import random
+import time
+
+
+def _alg001_engine(b: Union[Board, BitBoard], arg: str) -> Tuple[object, int]:
+    return _alg001(b).move, len(b.legal_moves())
+
+
+def _search_engine(b: Union[Board, BitBoard], arg: str) -> Tuple[object, int]:
+    """arg is the search depth (default 2)."""
+    search = GameState(b, int(arg or 2))
+    return search.best_move(), search.nodes + search.qnodes
+
+
+# Engines by name. A player is given as "name" or "name:arg" (e.g. search:3), and its engine is called with
+# the board and arg, returning the move to play and the number of nodes it searched.
+ENGINES = {
+    'alg001': _alg001_engine,
+    'search': _search_engine,
+}
+
+
+def engine_move(player: str, b: Union[Board, BitBoard]) -> Tuple[object, int]:
+    """Returns (move, nodes searched) of the engine of player on b."""
+    name, _, arg = player.partition(':')
+    return ENGINES[name](b, arg)
+
+
+def play_game(task: Dict[str, object]) -> Dict[str, object]:
+    """
+    Plays one game, possibly in a worker process. task holds the round number, the white and black players,
+    the board backend, the seed (a string) and number of random opening plies, and the adjudication settings:
+    - max_plies: the game is a draw after this many plies
+    - adjudicate_score, adjudicate_plies: a side wins once its material and piece-square lead has been at
+      least adjudicate_score for adjudicate_plies plies in a row
+    Returns a record of the game: its result, termination, moves in SAN and each side's moves, time and nodes.
+    """
+    b = new_board(task['backend'])
+    rng = random.Random(task['seed'])
+    moves = []
+    for _ in range(task['opening_plies']):
+        legal = b.legal_moves()
+        if not legal:
+            break
+        m = rng.choice(legal)
+        moves.append(san(b, m))
+        b.make_move(m)
+
+    stats = {color: {'moves': 0, 'time': 0.0, 'nodes': 0} for color in ('white', 'black')}
+    leader, lead_plies = None, 0
+    result, termination = '1/2-1/2', "adjudicated: move limit"
+    while len(moves) < task['max_plies']:
+        status = b.status()
+        if status == CHECKMATE:
+            result, termination = ('0-1' if b.turn else '1-0'), "checkmate"
+            break
+        if status != ONGOING:
+            result, termination = '1/2-1/2', {STALEMATE: "stalemate", REPETITION: "repetition",
+                                              FIFTY_MOVES: "fifty-move rule",
+                                              INSUFFICIENT: "insufficient material"}[status]
+            break
+        side = stats['white' if b.turn else 'black']
+        start = time.perf_counter()
+        m, nodes = engine_move(task['white' if b.turn else 'black'], b)
+        side['time'] += time.perf_counter() - start
+        side['moves'] += 1
+        side['nodes'] += nodes
+        moves.append(san(b, m))
+        b.make_move(m)
+
+        score = b.value(True)
+        if abs(score) >= task['adjudicate_score']:
+            lead_plies = lead_plies + 1 if leader == (score > 0) else 1
+            leader = score > 0
+            if lead_plies >= task['adjudicate_plies']:
+                result, termination = ('1-0' if leader else '0-1'), "adjudicated: material"
+                break
+        else:
+            leader, lead_plies = None, 0
+    else:
+        # The move limit was reached; the game may still have just ended on the board.
+        if b.status() == CHECKMATE:
+            result, termination = ('0-1' if b.turn else '1-0'), "checkmate"
+    return {'round': task['round'], 'white': task['white'], 'black': task['black'], 'result': result,
+            'termination': termination, 'opening_plies': task['opening_plies'], 'moves': moves, 'stats': stats}
+
+
+def elo_difference(score: float) -> Optional[float]:
+    """Returns the Elo difference implied by an expected score (0 to 1), or None if it is 0 or 1."""
+    if not 0 < score < 1:
+        return None
+    return -400 * math.log10(1 / score - 1)
+
+
+def summarise(games: List[Dict[str, object]]) -> Dict[str, object]:
+    """Returns W/D/L, score and Elo estimates of each pairing, and W/D/L, time per move and NPS of each player."""
+    pairings, players = {}, {}
+    for game in games:
+        white, black = game['white'], game['black']
+        points = {'1-0': 1.0, '0-1': 0.0, '1/2-1/2': 0.5}[game['result']]
+        for player, opponent, p, color in ((white, black, points, 'white'), (black, white, 1 - points, 'black')):
+            totals = players.setdefault(player, {'games': 0, 'wins': 0, 'draws': 0, 'losses': 0,
+                                                 'moves': 0, 'time': 0.0, 'nodes': 0})
+            totals['games'] += 1
+            totals[{1.0: 'wins', 0.5: 'draws', 0.0: 'losses'}[p]] += 1
+            for key in ('moves', 'time', 'nodes'):
+                totals[key] += game['stats'][color][key]
+            if (opponent, player) not in pairings:
+                pairing = pairings.setdefault((player, opponent), {'player': player, 'opponent': opponent,
+                                                                    'wins': 0, 'draws': 0, 'losses': 0})
+                pairing[{1.0: 'wins', 0.5: 'draws', 0.0: 'losses'}[p]] += 1
+    for pairing in pairings.values():
+        n = pairing['wins'] + pairing['draws'] + pairing['losses']
+        pairing['score'] = (pairing['wins'] + pairing['draws'] / 2) / n
+        pairing['elo'] = elo_difference(pairing['score'])
+    for totals in players.values():
+        totals['score'] = (totals['wins'] + totals['draws'] / 2) / totals['games']
+        totals['time_per_move'] = totals['time'] / max(totals['moves'], 1)
+        totals['nps'] = totals['nodes'] / max(totals['time'], 1e-9)
+    return {'pairings': list(pairings.values()), 'players': players}
+
+
+def run_tournament(players: List[str], games: int = 2, workers: int = 1, backend: str = 'bitboard',
+                   opening_plies: int = 4, max_plies: int = 200, adjudicate_score: float = 9,
+                   adjudicate_plies: int = 8, seed: int = 0) -> List[Dict[str, object]]:
+    """
+    Plays games games between every pair of players, across workers processes, and returns the game records
+    in round order. Each pair of games starts from the same random opening with the colours swapped.
+    """
+    tasks = []
+    for a, b in itertools.combinations(players, 2):
+        for i in range(games):
+            white, black = (a, b) if i % 2 == 0 else (b, a)
+            tasks.append({'round': len(tasks) + 1, 'white': white, 'black': black, 'backend': backend,
+                          'seed': f"{seed}:{a}:{b}:{i // 2}",
+                          'opening_plies': opening_plies, 'max_plies': max_plies,
+                          'adjudicate_score': adjudicate_score, 'adjudicate_plies': adjudicate_plies})
+    out = []
+    with ProcessPoolExecutor(workers) as pool:
+        for future in as_completed([pool.submit(play_game, task) for task in tasks]):
+            game = future.result()
+            out.append(game)
+            print(f"[{len(out)}/{len(tasks)}] round {game['round']}: {game['white']} - {game['black']} "
+                  f"{game['result']} ({game['termination']}, {len(game['moves'])} plies)")
+    return sorted(out, key=lambda game: game['round'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Plays engines against each other without a UI.")
+    parser.add_argument('players', nargs='+', help=f"players as name or name:arg, with names from {list(ENGINES)}")
+    parser.add_argument('--games', type=int, default=2, help="games per pair of players")
+    parser.add_argument('--workers', type=int, default=1, help="worker processes")
+    parser.add_argument('--backend', choices=list(BACKENDS), default='bitboard')
+    parser.add_argument('--opening-plies', type=int, default=4, help="random plies played before the engines")
+    parser.add_argument('--max-plies', type=int, default=200, help="plies after which a game is drawn")
+    parser.add_argument('--adjudicate-score', type=float, default=9,
+                        help="material lead that wins a game if held for --adjudicate-plies plies")
+    parser.add_argument('--adjudicate-plies', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pgn', default='selfplay.pgn', help="PGN output file")
+    parser.add_argument('--results', default='selfplay.json', help="machine-readable results file")
+    args = parser.parse_args()
+    for player in args.players:
+        if player.partition(':')[0] not in ENGINES:
+            parser.error(f"unknown engine in {player}")
+    if len(args.players) < 2:
+        parser.error("at least 2 players are needed")
+
+    settings = {key: value for key, value in vars(args).items() if key not in ('pgn', 'results')}
+    played = run_tournament(args.players, args.games, args.workers, args.backend, args.opening_plies,
+                            args.max_plies, args.adjudicate_score, args.adjudicate_plies, args.seed)
+    date = datetime.date.today().strftime('%Y.%m.%d')
+    with open(args.pgn, 'w') as f:
+        for g in played:
+            f.write(game_pgn({'Event': "chessbot self-play", 'Site': "?", 'Date': date, 'Round': str(g['round']),
+                              'White': g['white'], 'Black': g['black'], 'Termination': g['termination']},
+                             g['moves'], g['result']))
+    summary = summarise(played)
+    with open(args.results, 'w') as f:
+        json.dump({'settings': settings, 'games': [{k: v for k, v in g.items() if k != 'moves'} for g in played],
+                   **summary}, f, indent=2)
+
+    for p in summary['pairings']:
+        elo = "n/a" if p['elo'] is None else f"{p['elo']:+.0f}"
+        print(f"{p['player']} vs {p['opponent']}: +{p['wins']} ={p['draws']} -{p['losses']}  "
+              f"score {p['score']:.3f}  Elo {elo}")
+    for player, t in summary['players'].items():
+        print(f"{player}: +{t['wins']} ={t['draws']} -{t['losses']}  {1000 * t['time_per_move']:.1f} ms/move  "
+              f"{t['nps']:.0f} nodes/s")
+    print(f"wrote {args.pgn} and {args.results}")
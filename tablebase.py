@@ -0,0 +1,400 @@
+from bitboard import *
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import itertools
+import os
+import time
+import zlib
+from typing import *
+
+
+# Directory of the table files, one per ending, named by its signature (e.g. KQvKR.tb), next to this module.
+TB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tables')
+TB_PIECES = 4  # Tables are generated for the endings of up to this many pieces, kings included.
+ORDER = 'QRBNP'  # Piece letters from the strongest; a side's pieces are always listed in this order.
+LETTERS = {KING: 'K', QUEEN: 'Q', ROOK: 'R', BISHOP: 'B', KNIGHT: 'N', PAWN: 'P'}
+KIND_OF_LETTER = {letter: kind for kind, letter in LETTERS.items()}
+INVALID = 255  # The number of moves left of positions that are not legal, during generation.
+
+# A table holds one byte per position: 0 if it is a draw (or not a legal position), otherwise 1 plus the
+# number of plies to mate with best play. The side to move wins iff that number is odd.
+# Positions are indexed by the squares of the pieces, in the order of the signature (the stronger side's king
+# and pieces, then the other side's), and the side to move: 0 if it is the stronger side, 1 otherwise.
+# The stronger side always plays up the board, as white: positions where it is black are flipped.
+# Without pawns, the board can be mirrored and rotated, so the stronger side's king is always mapped into the
+# a1-d1-d4 triangle, which divides the size of a table by 6.4. A king on the a1-d4 diagonal can be mapped there
+# by two symmetries, and the smaller of the two indices is used, so that every position has one index.
+# With pawns, the board can only be mirrored left to right, so that king is mapped onto files a to d, which
+# halves the size of a table. Pawns only promote to queens, as in Board.make_move. En passant is left out:
+# double pushes are scored as if it were not possible, and positions just after one are not probed.
+
+
+def _transforms() -> List[List[int]]:
+    """Returns the 8 symmetries of the board, as the square each square is mapped to."""
+    out = []
+    for flip_file, flip_rank, swap in itertools.product((False, True), repeat=3):
+        table = []
+        for sq in range(64):
+            file, rank = sq % 8, sq // 8
+            if flip_file:
+                file = 7 - file
+            if flip_rank:
+                rank = 7 - rank
+            if swap:
+                file, rank = rank, file
+            table.append(rank * 8 + file)
+        out.append(table)
+    return out
+
+
+_TRIANGLE = [rank * 8 + file for file in range(4) for rank in range(file + 1)]
+_TRIANGLE_INDEX = {sq: i for i, sq in enumerate(_TRIANGLE)}
+# The symmetries used for positions with the stronger side's king on each square: two if they map it to the
+# diagonal, otherwise one.
+_TRANSFORMS = [[t for t in _transforms() if t[sq] in _TRIANGLE_INDEX] for sq in range(64)]
+# The same for tables with pawns, where the king is mapped onto the left half of the board.
+_HALF = [rank * 8 + file for file in range(4) for rank in range(8)]
+_HALF_INDEX = {sq: i for i, sq in enumerate(_HALF)}
+_MIRRORS = [t for t in _transforms() if all(t[sq] // 8 == sq // 8 for sq in range(64))]  # Keep the ranks.
+_PAWN_TRANSFORMS = [[t for t in _MIRRORS if t[sq] in _HALF_INDEX] for sq in range(64)]
+
+
+def _side_key(letters: str) -> Tuple[int, List[int]]:
+    """Orders the sides of an ending: more pieces first, then stronger pieces."""
+    return len(letters), [len(ORDER) - ORDER.index(c) for c in letters]
+
+
+def signatures(pieces: int = TB_PIECES) -> List[str]:
+    """Returns the signatures (e.g. KRvKN) of the endings of 3 to pieces pieces, fewest pieces first."""
+    out = []
+    for extra in range(1, pieces - 1):
+        for strong in range(extra, (extra - 1) // 2, -1):
+            for a in itertools.combinations_with_replacement(ORDER, strong):
+                for b in itertools.combinations_with_replacement(ORDER, extra - strong):
+                    if _side_key(''.join(a)) >= _side_key(''.join(b)):
+                        out.append(f"K{''.join(a)}vK{''.join(b)}")
+    return out
+
+
+def _pieces_of(signature: str) -> List[Tuple[int, int]]:
+    """Returns the (side, kind) of each piece of signature, in table order; side 0 is the stronger side."""
+    return [(side, KIND_OF_LETTER[c]) for side, letters in enumerate(signature.split('v')) for c in letters]
+
+
+def _encode(squares: List[int], side: int, pawns: bool = False) -> int:
+    """
+    Returns the table index of the pieces on squares (in table order) with side to move.
+    pawns is whether the table has pawns, which limits the symmetries used.
+    """
+    transforms, king_index = (_PAWN_TRANSFORMS, _HALF_INDEX) if pawns else (_TRANSFORMS, _TRIANGLE_INDEX)
+    out = None
+    for t in transforms[squares[0]]:
+        index = king_index[t[squares[0]]]
+        for sq in squares[1:]:
+            index = index << 6 | t[sq]
+        if out is None or index < out:
+            out = index
+    return out << 1 | side
+
+
+def _decode(key: int, n: int, pawns: bool = False) -> Tuple[List[int], int]:
+    """Returns the squares of the n pieces and the side to move of the position with table index key."""
+    side, index = key & 1, key >> 1
+    squares = [0] * n
+    for i in range(n - 1, 0, -1):
+        squares[i] = index & 63
+        index >>= 6
+    squares[0] = (_HALF if pawns else _TRIANGLE)[index]
+    return squares, side
+
+
+def _attacks(kind: int, sq: int, occupied: int, side: int = 0) -> int:
+    """Returns the squares attacked by a piece of side (0 plays up the board) on sq."""
+    if kind == PAWN:
+        return PAWN_ATTACKS[1 - side][sq]
+    if kind == KNIGHT:
+        return KNIGHT_ATTACKS[sq]
+    if kind == KING:
+        return KING_ATTACKS[sq]
+    if kind == ROOK:
+        return rook_attacks(sq, occupied)
+    if kind == BISHOP:
+        return bishop_attacks(sq, occupied)
+    return rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+
+
+class Tablebase:
+    """
+    The tables of a directory, loaded when first probed.
+    max_pieces is the most pieces of any ending with a table, so callers can skip probing bigger positions.
+    """
+    directory:  str
+    max_pieces: int
+    _signatures: Set[str]                # The endings with a table file.
+    _tables:    Dict[str, bytes]         # The tables loaded so far.
+
+    def __init__(self, directory: str = TB_DIR):
+        self.directory = directory
+        self._signatures = {name[:-3] for name in os.listdir(directory) if name.endswith('.tb')} \
+            if os.path.isdir(directory) else set()
+        self.max_pieces = max((len(s) - 1 for s in self._signatures), default=0)
+        self._tables = {}
+
+    def _table(self, signature: str) -> Optional[bytes]:
+        if signature not in self._tables:
+            if signature not in self._signatures:
+                return None
+            with open(os.path.join(self.directory, signature + '.tb'), 'rb') as f:
+                self._tables[signature] = zlib.decompress(f.read())
+        return self._tables[signature]
+
+    @staticmethod
+    def key_of(pieces: List[Tuple[int, int, int]], side: int) -> Optional[Tuple[str, int]]:
+        """
+        Returns the signature and table index of a position given as the (colour, kind, square) of each piece
+        and the colour to move, with colour 0 playing up the board. Returns None if only the kings are left.
+        """
+        letters = [''.join(sorted((LETTERS[kind] for colour, kind, _ in pieces if colour == c and kind != KING),
+                                  key=ORDER.index)) for c in (0, 1)]
+        if not letters[0] and not letters[1]:
+            return None
+        strong = 0 if _side_key(letters[0]) >= _side_key(letters[1]) else 1
+        flip = 56 if strong else 0  # Flips the ranks, so the stronger side plays up the board.
+        squares = []
+        for c in (strong, 1 - strong):
+            squares += [sq ^ flip for colour, kind, sq in pieces if colour == c and kind == KING]
+            squares += [sq ^ flip for _, sq in sorted((ORDER.index(LETTERS[kind]), sq) for colour, kind, sq in pieces
+                                                      if colour == c and kind != KING)]
+        signature = f"K{letters[strong]}vK{letters[1 - strong]}"
+        return signature, _encode(squares, int(side != strong), 'P' in signature)
+
+    def value(self, signature: str, key: int) -> Optional[int]:
+        """Returns the table byte of a position (see key_of), or None if there is no table for it."""
+        table = self._table(signature)
+        return table[key] if table is not None else None
+
+    def probe(self, b: Union[Board, BitBoard]) -> Optional[Tuple[int, int]]:
+        """
+        Returns (1, n) if the side to move on b mates in n plies, (-1, n) if it is mated in n plies and (0, 0)
+        if the position is a draw, or None if it is not in the tables. Positions with castling rights are not,
+        nor those just after a double pawn push, where en passant may be possible.
+        """
+        if b.piece_count() > self.max_pieces or b.castling_rights() or b.en_passant is not None:
+            return None
+        pieces = [(0 if p.white else 1, KIND_OF[p.type], square_index(p.file, p.rank)) for p in b.pieces()]
+        found = self.key_of(pieces, 0 if b.turn else 1)
+        if found is None:
+            return 0, 0
+        v = self.value(*found)
+        if v is None:
+            return None
+        if v == 0:
+            return 0, 0
+        return (1 if (v - 1) % 2 else -1), v - 1
+
+
+def generate(signature: str, directory: str = TB_DIR) -> Dict[str, object]:
+    """
+    Generates the table of signature by retrograde analysis and writes it to directory, where the tables of
+    the endings it can reach by a capture or promotion must already be. Returns statistics of the table.
+
+    Every legal position first gets its number of distinct successors. Checkmates have distance 0; then
+    for each distance d in turn, every predecessor (found by un-moving a piece) of a position lost in d
+    plies is won in d + 1, and every predecessor of a position won in d plies has that successor counted off,
+    being lost in d + 1 once none are left. Captures lead into smaller tables, whose values are fed in at their
+    distance, and so are those of promotions. Positions never reached are draws.
+    """
+    start = time.perf_counter()
+    pieces = _pieces_of(signature)
+    n = len(pieces)
+    kinds = [kind for _, kind in pieces]
+    side_pieces = [[i for i, (side, _) in enumerate(pieces) if side == s] for s in (0, 1)]
+    kings = [side_pieces[0][0], side_pieces[1][0]]
+    pawn_pieces = [i for i in range(n) if kinds[i] == PAWN]
+    pawns = bool(pawn_pieces)
+    forward = [8, -8]  # Pawn step of each side; side 0 plays up the board.
+    smaller = Tablebase(directory)
+    size = 2 * len(_HALF if pawns else _TRIANGLE) * 64 ** (n - 1)
+    counts = bytearray(size)
+    result = bytearray(size)
+    frontier = array('q')
+    events = {}  # Plies -> positions with a capture into a position decided in that many plies, as key << 1 | won.
+
+    def attacked(squares: List[int], target: int, side: int, occupied: int, captured: int) -> bool:
+        for i in side_pieces[side]:
+            if i != captured and _attacks(kinds[i], squares[i], occupied, side) >> target & 1:
+                return True
+        return False
+
+    def pawn_moves(sq: int, side: int, own: int, occupied: int) -> int:
+        """Returns the squares a pawn of side on sq can move to."""
+        to = sq + forward[side]
+        targets = PAWN_ATTACKS[1 - side][sq] & occupied & ~own
+        if not occupied >> to & 1:
+            targets |= 1 << to
+            if sq // 8 == (1 if side == 0 else 6) and not occupied >> (to + forward[side]) & 1:
+                targets |= 1 << (to + forward[side])
+        return targets
+
+    for key in range(size):
+        squares, s = _decode(key, n, pawns)
+        occupied = 0
+        for sq in squares:
+            occupied |= 1 << sq
+        # Indices that are not those of their position (see _encode) are left unused, like illegal positions.
+        if bin(occupied).count('1') != n or KING_ATTACKS[squares[kings[0]]] >> squares[kings[1]] & 1 or \
+                any(squares[i] // 8 in (0, 7) for i in pawn_pieces) or _encode(squares, s, pawns) != key or \
+                attacked(squares, squares[kings[1 - s]], s, occupied, -1):
+            counts[key] = INVALID
+            continue
+        own = 0
+        for i in side_pieces[s]:
+            own |= 1 << squares[i]
+        children, captures = set(), set()  # captures also holds promotions, which also leave the table.
+        for i in side_pieces[s]:
+            if kinds[i] == PAWN:
+                targets = pawn_moves(squares[i], s, own, occupied)
+            else:
+                targets = _attacks(kinds[i], squares[i], occupied) & ~own
+            while targets:
+                low = targets & -targets
+                targets ^= low
+                to = low.bit_length() - 1
+                captured = next((j for j in side_pieces[1 - s] if squares[j] == to), -1)
+                promoted = kinds[i] == PAWN and to // 8 in (0, 7)
+                moved = squares[:]
+                moved[i] = to
+                king = to if i == kings[s] else squares[kings[s]]
+                if attacked(moved, king, 1 - s, occupied ^ (1 << squares[i]) | low, captured):
+                    continue
+                if captured < 0 and not promoted:
+                    children.add(_encode(moved, 1 - s, pawns))
+                else:
+                    rest = [(pieces[j][0], QUEEN if j == i and promoted else kinds[j], moved[j])
+                            for j in range(n) if j != captured]
+                    captures.add(Tablebase.key_of(rest, 1 - s))
+        counts[key] = len(children) + len(captures)
+        if counts[key] == 0:
+            if attacked(squares, squares[kings[s]], 1 - s, occupied, -1):
+                result[key] = 1  # Checkmate.
+                frontier.append(key)
+            continue
+        for found in captures:
+            v = smaller.value(*found) if found is not None else 0
+            if v:
+                events.setdefault(v - 1, array('q')).append(key << 1 | ((v - 1) % 2 == 0))
+
+    plies = 0
+    while frontier or events:
+        decided = array('q')
+        for event in events.pop(plies, ()):
+            key = event >> 1
+            if result[key]:
+                continue
+            if not event & 1:
+                counts[key] -= 1
+                if counts[key]:
+                    continue
+            result[key] = plies + 2
+            decided.append(key)
+        for child in frontier:
+            lost = (result[child] - 1) % 2 == 0
+            squares, s = _decode(child, n, pawns)
+            occupied = 0
+            for sq in squares:
+                occupied |= 1 << sq
+            parents = set()
+            for i in side_pieces[1 - s]:
+                if kinds[i] == PAWN:
+                    # Un-pushes the pawn, by one square or, from its fourth rank, by two.
+                    sources, step = 0, forward[1 - s]
+                    before = squares[i] - step
+                    if not occupied >> before & 1 and 0 < before // 8 < 7:
+                        sources |= 1 << before
+                        if squares[i] // 8 == (3 if s == 1 else 4) and not occupied >> (before - step) & 1:
+                            sources |= 1 << (before - step)
+                else:
+                    sources = _attacks(kinds[i], squares[i], occupied) & ~occupied
+                while sources:
+                    low = sources & -sources
+                    sources ^= low
+                    moved = squares[:]
+                    moved[i] = low.bit_length() - 1
+                    parents.add(_encode(moved, 1 - s, pawns))
+            for key in parents:
+                if result[key] or counts[key] == INVALID:
+                    continue
+                if not lost:
+                    counts[key] -= 1
+                    if counts[key]:
+                        continue
+                result[key] = plies + 2
+                decided.append(key)
+        frontier = decided
+        plies += 1
+
+    with open(os.path.join(directory, signature + '.tb'), 'wb') as f:
+        packed = zlib.compress(bytes(result), 9)
+        f.write(packed)
+    legal = size - counts.count(INVALID)
+    draws = result.count(0) - counts.count(INVALID)
+    wins = sum(result.count(v) for v in range(2, 256, 2))
+    return {'signature': signature, 'positions': legal, 'wins': wins, 'losses': legal - draws - wins,
+            'draws': draws, 'longest': max((v - 1 for v in range(1, 256) if v in result), default=0),
+            'bytes': len(packed), 'time': time.perf_counter() - start}
+
+
+def generate_all(directory: str = TB_DIR, pieces: int = TB_PIECES, workers: int = 1,
+                 only: List[str] = None) -> List[Dict[str, object]]:
+    """
+    Generates the tables of all endings of up to pieces pieces (or only those listed), using workers
+    processes. Endings with the same number of pieces and pawns are independent, so they are generated in
+    parallel, after those with fewer pieces they can capture into and those with fewer pawns they can
+    promote into.
+    """
+    os.makedirs(directory, exist_ok=True)
+    out = []
+    for count in range(3, pieces + 1):
+        for pawns in range(count - 1):
+            batch = [s for s in signatures(pieces) if len(s) - 1 == count and s.count('P') == pawns and
+                     (only is None or s in only)]
+            if workers > 1 and len(batch) > 1:
+                with ProcessPoolExecutor(min(workers, len(batch))) as pool:
+                    out += pool.map(generate, batch, [directory] * len(batch))
+            else:
+                out += [generate(signature, directory) for signature in batch]
+    return out
+
+
+_tablebases = {}  # The tablebases opened by open_tablebase, by directory.
+
+
+def open_tablebase(directory: str = TB_DIR) -> Tablebase:
+    """Returns the tablebase of directory, which is empty if there is no such directory."""
+    if directory not in _tablebases:
+        _tablebases[directory] = Tablebase(directory)
+    return _tablebases[directory]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generates endgame tables and benchmarks their generation.")
+    parser.add_argument('--dir', default=TB_DIR)
+    parser.add_argument('--pieces', type=int, default=TB_PIECES, help="most pieces of an ending, kings included")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument('--only', nargs='+', help="signatures of the endings to generate (e.g. KQvK KRvK)")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="generate the tables with 1 worker and then with --workers, reporting the speedup")
+    args = parser.parse_args()
+    runs = [1, args.workers] if args.benchmark else [args.workers]
+    elapsed = []
+    for workers in runs:
+        start = time.perf_counter()
+        stats = generate_all(args.dir, args.pieces, workers, args.only)
+        elapsed.append(time.perf_counter() - start)
+        for s in stats:
+            print(f"{s['signature']:<7} {s['positions']:>9} positions  +{s['wins']} ={s['draws']} -{s['losses']}  "
+                  f"longest {s['longest']:>3} plies  {s['bytes']:>8} bytes  {s['time']:8.2f}s")
+        print(f"{len(stats)} tables in {elapsed[-1]:.2f}s with {workers} worker(s), {os.cpu_count()} CPUs")
+    if args.benchmark:
+        print(f"speedup with {args.workers} workers: {elapsed[0] / elapsed[1]:.2f}x")